@@ -1,11 +1,43 @@
 # -*- coding: utf-8 -*-
 
-import requests
+import gzip
+import hashlib
+import heapq
+import json
+import marshal
+import os
+import shelve
+import tempfile
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import profiling
 
 WIKTIONARY = 'http://en.wiktionary.org/wiki/'
+HTTP_CACHE_FILE = 'wiktionary.cache'
+HTML_ARCHIVE = 'html_archive'
+HTTP_POOL_SIZE = 16
+# Seconds to wait for Wiktionary to connect or send more of a page. A fetch
+# that times out raises, and the word is reported as bad like any other
+# failed download.
+HTTP_TIMEOUT = 30
+# hit: answered 304 and served from the cache, miss: no cached copy,
+# revalidate: conditional request sent for a cached copy
+CACHE_STATS = {'hit': 0, 'miss': 0, 'revalidate': 0}
 
 NOUNS_FILE = 'nouns.txt'
 NOUNS_REVERSE = 'reverse_nouns.txt'
+NOUNS_MANIFEST = 'nouns.manifest'
+DECK_FLUSH_SIZE = 1000
+SORT_RUN_SIZE = 100000
+# The files --diff-against writes beside each card file
+DECK_CHANGES = ['added', 'changed', 'removed']
+# Forms whose keys are kept before the cache starts over, so that a streamed
+# build still runs in flat memory
+FORM_KEYS_SIZE = 200000
+ACCENTS = u'\u0300\u0301\u0342'
+LENGTH_MARKS = u'\u0304\u0306'
 FIRST_DECL = (['ἡ χώρα', 'ἡ νίκη', 'ἡ φυγή', 'ἡ μοῖρα', 'ἡ γλῶττα',
                'ἡ θάλαττα'] +
               ['ὁ νεανίας', 'ὁ πολίτης', 'ὁ κριτής', 'ὁ Ἀτρείδης'] +
@@ -77,9 +109,313 @@ ARTICLE_MAP = {'m': {'Singular': {'Nominative': u'ὁ',
                                   'Vocative': u'τὰ'}, }}
 
 
+HTTP_LOCK = threading.Lock()
+HTTP_SESSION = None
+HTTP_CACHE = None
+ARCHIVE_INDEX = None
+
+
 def get_html_from_wiktionary(word):
     print ("Called for " + unicode(word, 'utf-8')).encode('utf-8')
-    return requests.get(WIKTIONARY + word.split(' ')[-1]).content
+    html = get_url(WIKTIONARY + word.split(' ')[-1])
+    if ARCHIVE_INDEX is not None:
+        digest = archive_html(html)
+        with HTTP_LOCK:
+            ARCHIVE_INDEX[word] = digest
+    return html
+
+
+def http_session():
+    global HTTP_SESSION
+    with HTTP_LOCK:
+        if HTTP_SESSION is None:
+            # Imported here as it takes longer than the rest of startup
+            import requests
+            adapter = requests.adapters.HTTPAdapter(
+                pool_maxsize=HTTP_POOL_SIZE)
+            HTTP_SESSION = requests.Session()
+            HTTP_SESSION.mount('http://', adapter)
+            HTTP_SESSION.mount('https://', adapter)
+    return HTTP_SESSION
+
+
+def open_http_cache(filename=HTTP_CACHE_FILE):
+    global HTTP_CACHE
+    HTTP_CACHE = shelve.open(filename)
+
+
+def close_http_cache():
+    global HTTP_CACHE
+    if HTTP_CACHE is not None:
+        HTTP_CACHE.close()
+        HTTP_CACHE = None
+
+
+def open_html_archive():
+    global ARCHIVE_INDEX
+    if not os.path.isdir(HTML_ARCHIVE):
+        os.makedirs(HTML_ARCHIVE)
+    ARCHIVE_INDEX = shelve.open(os.path.join(HTML_ARCHIVE, 'index'))
+
+
+def close_html_archive():
+    global ARCHIVE_INDEX
+    if ARCHIVE_INDEX is not None:
+        ARCHIVE_INDEX.close()
+        ARCHIVE_INDEX = None
+
+
+def archive_path(digest):
+    return os.path.join(HTML_ARCHIVE, digest[:2], digest + '.gz')
+
+
+def archive_html(html):
+    # Pages are stored gzipped under their sha1, so a page fetched for
+    # several words, or fetched again unchanged, is stored once
+    digest = hashlib.sha1(html).hexdigest()
+    path = archive_path(digest)
+    if not os.path.exists(path):
+        if not os.path.isdir(os.path.dirname(path)):
+            try:
+                os.makedirs(os.path.dirname(path))
+            except OSError:
+                pass
+        tmp = path + '.%d.tmp' % threading.current_thread().ident
+        ff = gzip.open(tmp, 'wb')
+        try:
+            ff.write(html)
+        finally:
+            ff.close()
+        os.rename(tmp, path)
+    return digest
+
+
+def read_archive(digest):
+    ff = gzip.open(archive_path(digest), 'rb')
+    try:
+        return ff.read()
+    finally:
+        ff.close()
+
+
+def archived_words():
+    return ARCHIVE_INDEX.keys()
+
+
+def archived_html(word):
+    return read_archive(ARCHIVE_INDEX[word])
+
+
+@profiling.stage('fetch')
+def get_url(url):
+    cached = None
+    if HTTP_CACHE is not None:
+        with HTTP_LOCK:
+            cached = HTTP_CACHE.get(url)
+        if cached and not os.path.exists(archive_path(cached['digest'])):
+            cached = None
+
+    headers = {}
+    if cached:
+        if cached['etag']:
+            headers['If-None-Match'] = cached['etag']
+        if cached['last_modified']:
+            headers['If-Modified-Since'] = cached['last_modified']
+
+    profiling.count('fetches')
+    response = http_session().get(url, headers=headers,
+                                  timeout=HTTP_TIMEOUT)
+
+    with HTTP_LOCK:
+        if not cached:
+            CACHE_STATS['miss'] += 1
+        else:
+            CACHE_STATS['revalidate'] += 1
+            if response.status_code == 304:
+                CACHE_STATS['hit'] += 1
+                return read_archive(cached['digest'])
+
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if (HTTP_CACHE is not None and response.status_code == 200 and
+                (etag or last_modified)):
+            HTTP_CACHE[url] = {'etag': etag,
+                               'last_modified': last_modified,
+                               'digest': archive_html(response.content)}
+    return response.content
+
+
+def show_cache_stats():
+    if sum(CACHE_STATS.values()):
+        print 'Wiktionary cache: %(hit)d hit, %(miss)d miss, ' \
+              '%(revalidate)d revalidate' % CACHE_STATS
+
+
+class DeckWriter(object):
+    # Buffers the lines of one card file. Every flush_size lines the buffer
+    # goes to a temporary file, which only replaces the card file when the
+    # writer is closed, so a failed build never leaves half a deck behind.
+
+    def __init__(self, filename, flush_size=DECK_FLUSH_SIZE):
+        self.filename = filename
+        self.flush_size = flush_size
+        self.tmpname = filename + '.tmp'
+        self.lines = []
+        self.count = 0
+        self.ff = open(self.tmpname, 'w')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def write(self, line):
+        if profiling.ENABLED:
+            profiling.count('cards_written')
+        self.count += 1
+        self.lines.append(line + "\n")
+        if len(self.lines) >= self.flush_size:
+            self.flush()
+
+    @profiling.stage('write')
+    def flush(self):
+        self.ff.write(''.join(self.lines))
+        self.lines = []
+
+    @profiling.stage('write')
+    def close(self):
+        self.flush()
+        self.ff.flush()
+        os.fsync(self.ff.fileno())
+        self.ff.close()
+        os.rename(self.tmpname, self.filename)
+
+    def abort(self):
+        self.ff.close()
+        os.unlink(self.tmpname)
+
+
+def diff_filename(filename, change):
+    # nouns.txt and 'added' give nouns.added.txt
+    base, ext = os.path.splitext(filename)
+    return base + '.' + change + ext
+
+
+def read_cards(filename):
+    # The lines of a card file by front, the field Anki matches notes on,
+    # in the order the fronts first appear
+    cards = OrderedDict()
+    try:
+        with open(filename) as ff:
+            for line in ff:
+                line = line.rstrip('\n')
+                cards.setdefault(line.split('; ', 1)[0], []).append(line)
+    except IOError:
+        pass
+    return cards
+
+
+@profiling.stage('diff')
+def write_deck_diff(filename, previous_dir, flush_size=DECK_FLUSH_SIZE):
+    # Writes the cards of a card file that were added, changed or removed
+    # since the file of the same name in previous_dir, each set to its own
+    # card file. Changed cards are written as they are now and removed ones
+    # as they were.
+    if not os.path.isdir(previous_dir):
+        raise Exception('No previous build in ' + previous_dir)
+    previous = read_cards(os.path.join(previous_dir,
+                                       os.path.basename(filename)))
+    current = read_cards(filename)
+    writers = [DeckWriter(diff_filename(filename, change), flush_size)
+               for change in DECK_CHANGES]
+    added, changed, removed = writers
+    try:
+        for front, lines in current.iteritems():
+            if front not in previous:
+                writer = added
+            elif previous[front] != lines:
+                writer = changed
+            else:
+                continue
+            for line in lines:
+                writer.write(line)
+        for front, lines in previous.iteritems():
+            if front not in current:
+                for line in lines:
+                    removed.write(line)
+    except:
+        for writer in writers:
+            writer.abort()
+        raise
+    for change, writer in zip(DECK_CHANGES, writers):
+        profiling.count('cards_' + change, writer.count)
+        writer.close()
+
+
+class SortedRuns(object):
+    # Sorts more records than we want to hold at once. Every run_size
+    # records are sorted and spilled to a temporary file, and merged()
+    # reads the runs back in step. Records must be marshallable.
+
+    def __init__(self, run_size=SORT_RUN_SIZE):
+        self.run_size = run_size
+        self.records = []
+        self.runs = []
+
+    def add(self, record):
+        self.records.append(record)
+        if len(self.records) >= self.run_size:
+            self.spill()
+
+    def spill(self):
+        self.records.sort()
+        ff = tempfile.TemporaryFile()
+        for record in self.records:
+            marshal.dump(record, ff)
+        self.runs.append(ff)
+        self.records = []
+
+    def merged(self):
+        self.records.sort()
+        runs = [read_run(ff) for ff in self.runs] + [iter(self.records)]
+        try:
+            for record in heapq.merge(*runs):
+                yield record
+        finally:
+            self.close()
+
+    def close(self):
+        for ff in self.runs:
+            ff.close()
+        self.runs = []
+        self.records = []
+
+
+def read_run(ff):
+    ff.seek(0)
+    while True:
+        try:
+            yield marshal.load(ff)
+        except EOFError:
+            return
+
+
+def load_json(filename):
+    try:
+        with open(filename) as ff:
+            return json.load(ff)
+    except (IOError, ValueError):
+        return None
+
+
+def save_json(filename, data):
+    with open(filename + '.tmp', 'w') as ff:
+        json.dump(data, ff)
+    os.rename(filename + '.tmp', filename)
 
 
 def article_from_gender(gender):
@@ -91,13 +427,130 @@ def article_from_gender(gender):
         return u'τὸ'
 
 
+# The keys of each form seen so far, one dict for utf-8 str and one for
+# unicode so that each form gets its keys back in its own type
+NFC_KEYS = {str: {}, unicode: {}}
+FOLDED_KEYS = {str: {}, unicode: {}}
+
+
+def nfc_key(form):
+    # The form in NFC, with a macron or breve after the other marks on its
+    # letter as the shelves write them (λύ̄ω). Worked out once per form, so
+    # dedup and lookup loops only pay for a dict lookup.
+    cache = NFC_KEYS[type(form)]
+    key = cache.get(form)
+    if key is None:
+        key = cached_key(cache, form, False)
+    return key
+
+
+def folded_key(form):
+    # The form with no accents or length marks at all (λυω)
+    cache = FOLDED_KEYS[type(form)]
+    key = cache.get(form)
+    if key is None:
+        key = cached_key(cache, form, True)
+    return key
+
+
+def form_keys(form):
+    return nfc_key(form), folded_key(form)
+
+
+def cached_key(cache, form, fold):
+    if len(cache) >= FORM_KEYS_SIZE:
+        cache.clear()
+    text = form.decode('utf-8') if isinstance(form, str) else form
+    decomposed = unicodedata.normalize('NFD', text)
+    if fold:
+        key = u''.join(char for char in decomposed
+                       if char not in ACCENTS and char not in LENGTH_MARKS)
+    elif LENGTH_MARKS[0] in decomposed or LENGTH_MARKS[1] in decomposed:
+        key = u''.join(move_lengths(decomposed))
+    else:
+        key = decomposed
+    key = unicodedata.normalize('NFC', key)
+    if key == text:
+        # Most forms are stored normalized: keep the one string
+        key = form
+    elif isinstance(form, str):
+        key = key.encode('utf-8')
+    cache[form] = key
+    profiling.count('forms_normalized')
+    return key
+
+
+def move_lengths(decomposed):
+    lengths = []
+    for char in decomposed:
+        if char in LENGTH_MARKS:
+            lengths.append(char)
+        elif unicodedata.combining(char):
+            yield char
+        else:
+            for length in lengths:
+                yield length
+            lengths = []
+            yield char
+    for length in lengths:
+        yield length
+
+
+def word_index(words):
+    # Each folded key with the words that have it, in the order given
+    index = {}
+    for word in words:
+        index.setdefault(form_keys(word)[1], []).append(word)
+    return index
+
+
+def find_word(word, shelf, index=None):
+    # The word as the shelf keys it: itself, the word with the same NFC key
+    # or else the first with the same folded key. Callers looking up many
+    # words pass the word_index of the shelf's keys, built once.
+    if word in shelf:
+        return word
+    exact, folded = form_keys(word)
+    if index is None:
+        index = word_index(shelf.keys())
+    matches = index.get(folded, [])
+    for key in matches:
+        if form_keys(key)[0] == exact:
+            return key
+    return matches[0] if matches else word
+
+
+def show_analyses(form, shelf):
+    analyses = shelf.analyze(form)
+    if not analyses:
+        print form + ': no analysis found'
+    for analysis in analyses:
+        parts = [analysis[key] for key in
+                 ['voice', 'mood', 'tense', 'person', 'number', 'gram_case',
+                  'gender'] if key in analysis]
+        print '%s: %s (%s)' % (analysis['lemma'], ' '.join(parts),
+                               analysis['form'])
+
+
+def sorted_repr(node):
+    # repr of nested dicts with their keys sorted, so a paradigm prints the
+    # same from a store's dicts as from an index's OrderedDicts
+    if isinstance(node, dict):
+        return '{%s}' % ', '.join('%r: %s' % (key, sorted_repr(node[key]))
+                                  for key in sorted(node))
+    return repr(node)
+
+
 def show_forms(noun, shelf):
-    forms = shelf[noun]
-    print unicode(repr(forms), 'utf-8')
-    for kk in forms.keys():
+    forms = shelf[find_word(noun, shelf)]
+    print unicode(sorted_repr(forms), 'utf-8')
+    for kk in sorted(forms):
         print kk
         if kk != 'gender':
-            for key, value in forms[kk].iteritems():
+            for key in sorted(forms[kk]):
+                value = forms[kk][key]
+                if isinstance(value, dict):
+                    value = sorted_repr(value)
                 print key, value
         else:
             print forms[kk]
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+
+import base64
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+import zipfile
+
+import profiling
+
+DECK_PREFIX = 'Greek::'
+NOTE_FLUSH_SIZE = 1000
+TAGS_RE = re.compile(r'<[^>]*>')
+CARD_CSS = ('.card {\n font-family: arial;\n font-size: 20px;\n'
+            ' text-align: center;\n color: black;\n background-color: white;\n'
+            '}\n')
+# The verb answers line up tense diagrams, see the README
+MONOSPACE_CSS = CARD_CSS.replace('arial', 'menlo, monospace')
+
+# Anki's schema 11 collection, which every version can import
+SCHEMA = [
+    'CREATE TABLE col (id integer primary key, crt integer not null, '
+    'mod integer not null, scm integer not null, ver integer not null, '
+    'dty integer not null, usn integer not null, ls integer not null, '
+    'conf text not null, models text not null, decks text not null, '
+    'dconf text not null, tags text not null)',
+    'CREATE TABLE notes (id integer primary key, guid text not null, '
+    'mid integer not null, mod integer not null, usn integer not null, '
+    'tags text not null, flds text not null, sfld integer not null, '
+    'csum integer not null, flags integer not null, data text not null)',
+    'CREATE TABLE cards (id integer primary key, nid integer not null, '
+    'did integer not null, ord integer not null, mod integer not null, '
+    'usn integer not null, type integer not null, queue integer not null, '
+    'due integer not null, ivl integer not null, factor integer not null, '
+    'reps integer not null, lapses integer not null, left integer not null, '
+    'odue integer not null, odid integer not null, flags integer not null, '
+    'data text not null)',
+    'CREATE TABLE revlog (id integer primary key, cid integer not null, '
+    'usn integer not null, ease integer not null, ivl integer not null, '
+    'lastIvl integer not null, factor integer not null, '
+    'time integer not null, type integer not null)',
+    'CREATE TABLE graves (usn integer not null, oid integer not null, '
+    'type integer not null)',
+]
+# Built once the rows are in, which is quicker than keeping them up to date
+INDEXES = [
+    'CREATE INDEX ix_notes_usn ON notes (usn)',
+    'CREATE INDEX ix_cards_usn ON cards (usn)',
+    'CREATE INDEX ix_revlog_usn ON revlog (usn)',
+    'CREATE INDEX ix_cards_nid ON cards (nid)',
+    'CREATE INDEX ix_cards_sched ON cards (did, queue, due)',
+    'CREATE INDEX ix_revlog_cid ON revlog (cid)',
+    'CREATE INDEX ix_notes_csum ON notes (csum)',
+]
+DECK_CONF = {'1': {'id': 1, 'name': 'Default', 'mod': 0, 'usn': 0,
+                   'maxTaken': 60, 'autoplay': True, 'timer': 0,
+                   'replayq': True, 'dyn': False,
+                   'new': {'bury': True, 'delays': [1, 10],
+                           'initialFactor': 2500, 'ints': [1, 4, 7],
+                           'order': 1, 'perDay': 20, 'separate': True},
+                   'lapse': {'delays': [10], 'leechAction': 0,
+                             'leechFails': 8, 'minInt': 1, 'mult': 0},
+                   'rev': {'bury': True, 'ease4': 1.3, 'fuzz': 0.05,
+                           'ivlFct': 1, 'maxIvl': 36500, 'minSpace': 1,
+                           'perDay': 100}}}
+
+
+def package_for(textfile):
+    # The package and deck name that go with a card file: verbs.present.txt
+    # becomes verbs.present.apkg holding the deck Greek::verbs.present
+    name = os.path.splitext(textfile)[0]
+    return name + '.apkg', DECK_PREFIX + os.path.basename(name)
+
+
+def stable_id(text):
+    # Deck and note type ids, the same in every build so that Anki files
+    # re-imported cards into the deck they came from
+    return int(hashlib.sha1(text).hexdigest()[:12], 16)
+
+
+def guid(key):
+    # Anki takes any short string as a guid; this is the first 64 bits of a
+    # hash of the key
+    return base64.b64encode(hashlib.sha1(key).digest()[:8])[:11]
+
+
+def field_checksum(field):
+    return int(hashlib.sha1(TAGS_RE.sub('', field)).hexdigest()[:8], 16)
+
+
+class ApkgWriter(object):
+    # Writes the lines of one card file as an Anki package instead. Notes
+    # are keyed by a guid from the deck, the lemma and the front of the
+    # card, so importing a rebuilt package updates the notes already in
+    # Anki rather than adding copies. Rows go in with executemany every
+    # flush_size notes, all in one transaction, and the package only
+    # replaces the old one when the writer is closed.
+
+    def __init__(self, filename, deck, css=CARD_CSS,
+                 flush_size=NOTE_FLUSH_SIZE):
+        self.filename = filename
+        self.deck = deck
+        self.flush_size = flush_size
+        self.tmpname = filename + '.tmp'
+        self.dbname = filename + '.anki2.tmp'
+        self.now = int(time.time())
+        self.deck_id = stable_id('deck\x1f' + deck)
+        self.model_id = stable_id('model\x1f' + deck)
+        self.css = css
+        self.next_id = self.now * 1000
+        self.notes = []
+        self.cards = []
+        self.lemma = None
+        self.fronts = {}
+        self.count = 0
+        if os.path.exists(self.dbname):
+            os.unlink(self.dbname)
+        self.db = sqlite3.connect(self.dbname)
+        self.db.text_factory = str
+        self.db.execute('PRAGMA journal_mode = OFF')
+        self.db.execute('PRAGMA synchronous = OFF')
+        for statement in SCHEMA:
+            self.db.execute(statement)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def write(self, line, lemma=None):
+        # Without a lemma the front must be unique in the deck. A lemma's
+        # lines come together, and its cards with the same front are told
+        # apart by the order they come in.
+        if profiling.ENABLED:
+            profiling.count('notes_written')
+        front, back = line.split('; ', 1)
+        parts = [self.deck, front]
+        if lemma is not None:
+            if lemma != self.lemma:
+                self.lemma = lemma
+                self.fronts = {}
+            seen = self.fronts.get(front, 0)
+            self.fronts[front] = seen + 1
+            parts = [self.deck, lemma, front, str(seen)]
+        key = guid('\x1f'.join(parts))
+        note_id = self.next_id
+        self.next_id += 1
+        self.count += 1
+        self.notes.append((note_id, key, self.model_id, self.now, -1, '',
+                           front + '\x1f' + back, TAGS_RE.sub('', front),
+                           field_checksum(front), 0, ''))
+        self.cards.append((note_id, note_id, self.deck_id, 0, self.now, -1,
+                           0, 0, self.count, 0, 0, 0, 0, 0, 0, 0, 0,
+                           ''))
+        if len(self.notes) >= self.flush_size:
+            self.flush()
+
+    @profiling.stage('package')
+    def flush(self):
+        self.db.executemany('INSERT INTO notes VALUES (' +
+                            ', '.join('?' * 11) + ')', self.notes)
+        self.db.executemany('INSERT INTO cards VALUES (' +
+                            ', '.join('?' * 18) + ')', self.cards)
+        self.notes = []
+        self.cards = []
+
+    @profiling.stage('package')
+    def close(self):
+        self.flush()
+        for statement in INDEXES:
+            self.db.execute(statement)
+        self.db.execute('INSERT INTO col VALUES (1, ?, ?, ?, 11, 0, 0, 0, '
+                        '?, ?, ?, ?, ?)',
+                        (self.now - self.now % 86400, self.now * 1000,
+                         self.now * 1000, json.dumps(self.conf()),
+                         json.dumps(self.models()), json.dumps(self.decks()),
+                         json.dumps(DECK_CONF), '{}'))
+        self.db.commit()
+        self.db.close()
+        with zipfile.ZipFile(self.tmpname, 'w', zipfile.ZIP_DEFLATED) as zz:
+            zz.write(self.dbname, 'collection.anki2')
+            zz.writestr('media', '{}')
+        os.unlink(self.dbname)
+        os.rename(self.tmpname, self.filename)
+
+    def abort(self):
+        self.db.close()
+        os.unlink(self.dbname)
+
+    def conf(self):
+        return {'activeDecks': [1], 'curDeck': 1, 'newSpread': 0,
+                'collapseTime': 1200, 'timeLim': 0, 'estTimes': True,
+                'dueCounts': True, 'curModel': str(self.model_id),
+                'nextPos': self.count + 1, 'sortType': 'noteFld',
+                'sortBackwards': False, 'addToCur': True}
+
+    def models(self):
+        fields = [{'name': name, 'ord': ii, 'sticky': False, 'rtl': False,
+                   'font': 'Arial', 'size': 20, 'media': []}
+                  for ii, name in enumerate(['Front', 'Back'])]
+        template = {'name': 'Card 1', 'ord': 0, 'qfmt': '{{Front}}',
+                    'afmt': '{{FrontSide}}\n\n<hr id=answer>\n\n{{Back}}',
+                    'did': None, 'bqfmt': '', 'bafmt': ''}
+        model = {'id': self.model_id, 'name': self.deck, 'type': 0,
+                 'mod': self.now, 'usn': -1, 'sortf': 0,
+                 'did': self.deck_id, 'tmpls': [template], 'flds': fields,
+                 'css': self.css, 'latexPre': '', 'latexPost': '',
+                 'tags': [], 'vers': [], 'req': [[0, 'any', [0]]]}
+        return {str(self.model_id): model}
+
+    def decks(self):
+        decks = {}
+        for deck_id, name in [(1, 'Default'), (self.deck_id, self.deck)]:
+            decks[str(deck_id)] = {'id': deck_id, 'name': name,
+                                   'mod': self.now, 'usn': -1, 'desc': '',
+                                   'dyn': 0, 'conf': 1, 'collapsed': False,
+                                   'extendNew': 10, 'extendRev': 50,
+                                   'newToday': [0, 0], 'revToday': [0, 0],
+                                   'lrnToday': [0, 0], 'timeToday': [0, 0]}
+        return decks
@@ -0,0 +1,755 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import BaseHTTPServer
+import copy
+import json
+import os
+import resource
+import shutil
+import SocketServer
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import timeit
+import urllib
+
+import ankigreekutil as anki
+import conjugation
+import declension
+import nouns
+import paradigmdata
+import verbs
+from paradigmstore import ParadigmStore
+
+NUMBERS = ['Singular', 'Dual', 'Plural']
+CASES = ['Nominative', 'Genitive', 'Dative', 'Accusative', 'Vocative']
+GENDERS = {'ὁ': 'masculine', 'ἡ': 'feminine', 'τὸ': 'neuter'}
+
+
+def main():
+    args = parse_args()
+    for name in args.benchmarks or BENCHMARKS:
+        if name not in BENCHMARKS:
+            raise Exception('Unknown benchmark: ' + name)
+    failed = False
+    for name in args.benchmarks or BENCHMARKS:
+        print '== ' + name
+        failed = globals()['bench_' + name](args) or failed
+    if failed:
+        sys.exit(1)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser('Bench')
+    parser.add_argument('benchmarks', nargs='*',
+                        help="benchmarks to run: " + ', '.join(BENCHMARKS))
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--padding', type=int, default=1000,
+                        help="lines of other markup around each table")
+    parser.add_argument('--archive', action='store_true',
+                        help="use the pages in html_archive/ as fixtures")
+    parser.add_argument('--verbs', default='1,10,100,1000',
+                        help="comma-separated synthetic verb counts")
+    parser.add_argument('--size', type=int, default=100,
+                        help="nouns and verbs in the suite's synthetic "
+                        "shelves")
+    parser.add_argument('--save', metavar='FILE',
+                        help="write the suite's results as a JSON baseline")
+    parser.add_argument('--compare', metavar='FILE',
+                        help="fail if the suite is slower or bigger than "
+                        "a saved baseline")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="how much worse than the baseline is allowed")
+    parser.add_argument('--jobs', type=int, default=nouns.FETCH_JOBS,
+                        help="fetch threads prefetch compares with one")
+    parser.add_argument('--latency', type=float, default=0.01,
+                        help="seconds the prefetch server takes per page")
+    return parser.parse_args()
+
+
+BENCHMARKS = ['parser', 'grouping', 'answers', 'paradigms', 'suite',
+              'startup', 'declension', 'conjugation', 'prefetch', 'hashseed']
+# Pipeline stages timed by the suite, each set up by its case_ function
+SUITE = ['noun_parse', 'noun_forms', 'noun_defs', 'noun_files',
+         'verb_set_forms', 'verb_make_cards', 'verb_output']
+# Seconds a quick command may take from start to exit, on the median run.
+# Interpreter startup alone is a fifth of it, so it leaves room for a
+# loaded machine without letting a slow import through.
+STARTUP_TARGET = 0.15
+# Commands timed by the startup benchmark, run from a directory holding
+# only the curated paradigms
+STARTUP = [['verbs.py', '--show', 'λύω'],
+           ['nouns.py', '--show', 'ἡ μνᾶ'],
+           ['verbs.py', '--get', 'λύω'],
+           ['verbs.py', '--anki']]
+# Hash seeds the hashseed benchmark builds the verb decks under, and the
+# ways it builds them
+HASH_SEEDS = ['0', '1', '2']
+HASH_SEED_BUILDS = [['verbs.py', '--get', 'λύω', '--anki'],
+                    ['verbs.py', '--get', 'λύω', '--anki', '--stream'],
+                    ['verbs.py', '--get', 'λύω', '--anki', '--jobs', '2']]
+HASH_SEED_FILES = ['verbs.txt', 'reverse_verbs.txt']
+
+
+def link(form):
+    return ('<a href="/wiki/' + urllib.quote(form) + '#Ancient_Greek" ' +
+            'title="' + form + '">' + form + '</a>')
+
+
+def noun_page(word, forms, padding):
+    # A page laid out like a Wiktionary entry: another language's section,
+    # the Ancient Greek headword and declension table, then more sections
+    article, lemma = word.split(' ')
+    lines = ['<!DOCTYPE html>',
+             '<html lang="en" dir="ltr" class="client-nojs">',
+             '<head><title>' + lemma + ' - Wiktionary</title>',
+             '<script>document.documentElement.className = "client-js";' +
+             '</script></head>',
+             '<body class="mediawiki ltr sitedir-ltr">',
+             '<h2><span class="mw-headline" id="Greek">Greek</span></h2>',
+             '<table class="translations" role="presentation">']
+    for ii in range(padding):
+        lines.append('<tr><td><span class="Grek" lang="el">' +
+                     link('λέξη%d' % ii) + '</span> <span class="gender">' +
+                     '<abbr title="neuter">n</abbr></span></td></tr>')
+    lines.append('</table>')
+    lines.append('<h2><span class="mw-headline" id="Ancient_Greek">' +
+                 'Ancient Greek</span></h2>')
+    headword = ('<p><strong class="Polyt headword" lang="grc">' + lemma +
+                '</strong>')
+    if article in GENDERS:
+        gender = GENDERS[article]
+        headword += ('&#160;<span class="gender"><abbr title="' + gender +
+                     ' gender">' + gender[0] + '</abbr></span>')
+    lines.append(headword + '</p>')
+
+    numbers = [number for number in NUMBERS if number in forms]
+    lines.append('<div class="NavFrame"><div class="NavContent">')
+    lines.append('<table class="prettytable inflection-table" ' +
+                 'style="width:100%; text-align:center;">')
+    lines.append('<tr>')
+    lines.append('<th style="background:#c0cfe4" width="16%">' +
+                 '<span style="font-size:90%">Case / #</span></th>')
+    for number in numbers:
+        lines.append('<th style="background:#c0cfe4">' + number + '</th>')
+    lines.append('</tr>')
+    for case in CASES:
+        lines.append('<tr>')
+        lines.append('<th style="background:#c0cfe4">' + case + '</th>')
+        for number in numbers:
+            form = forms[number][case].encode('utf-8')
+            if case == 'Vocative':
+                cell = '<span class="Polyt" lang="grc">' + form + '</span>'
+            else:
+                cell = ('<span class="Polyt" lang="grc">' + link(form) +
+                        '</span>')
+            lines.append('<td style="background:#f8f8ff">' + cell + '</td>')
+        lines.append('</tr>')
+    lines.append('</table></div></div>')
+
+    for ii in range(padding):
+        lines.append('<li><span class="Polyt" lang="grc">' +
+                     link('παράγωγον%d' % ii) + '</span></li>')
+    lines.append('</body></html>')
+    return '\n'.join(lines)
+
+
+def noun_fixtures(padding):
+    nouns.SHELF = {}
+    nouns.prepare_shelf()
+    return [noun_page(word, nouns.SHELF[word], padding)
+            for word in sorted(nouns.SHELF.keys())]
+
+
+def check_noun_parsers(pages):
+    for page in pages:
+        streamed = nouns.get_noun_forms(page)
+        by_line = nouns.get_noun_forms_by_line(page)
+        if streamed != by_line:
+            raise Exception('Parsers disagree: ' + repr(streamed) + ' != ' +
+                            repr(by_line))
+    print 'get_noun_forms matches get_noun_forms_by_line on %d pages' % \
+        len(pages)
+
+
+def time_per_call(func, pages, repeat):
+    best = min(timeit.repeat(lambda: map(func, pages), number=1,
+                             repeat=repeat))
+    return best / len(pages)
+
+
+def bench_parser(args):
+    if args.archive:
+        anki.open_html_archive()
+        pages = [anki.archived_html(word) for word in anki.archived_words()]
+        anki.close_html_archive()
+    else:
+        pages = noun_fixtures(args.padding)
+    check_noun_parsers(pages)
+    repeat = args.repeat
+    size = sum(map(len, pages)) / len(pages)
+    by_line = time_per_call(nouns.get_noun_forms_by_line, pages, repeat)
+    streamed = time_per_call(nouns.get_noun_forms, pages, repeat)
+    print 'pages of %d bytes on average' % size
+    print 'get_noun_forms_by_line: %8.3f ms/page' % (by_line * 1000)
+    print 'get_noun_forms:         %8.3f ms/page (%.1fx)' % \
+        (streamed * 1000, by_line / streamed)
+
+
+def synthetic_verbs(count):
+    # count copies of λύω, each with its forms made distinct by a number
+    verbs.SHELF = {}
+    verbs.prepare_shelf()
+    luo = verbs.SHELF['λύω']
+    shelf = {}
+    for ii in range(count):
+        shelf['λύω%d' % ii] = renumber(copy.deepcopy(luo), '%d' % ii)
+    return shelf
+
+
+def renumber(node, prefix):
+    for key, value in node.items():
+        if isinstance(value, dict):
+            renumber(value, prefix)
+        elif value:
+            node[key] = prefix + value
+    return node
+
+
+def bench_grouping(args):
+    print '%8s %10s %12s %14s %14s' % ('verbs', 'cards', 'group ms',
+                                       'group us/card', 'output us/card')
+    for count in map(int, args.verbs.split(',')):
+        shelf = synthetic_verbs(count)
+        cards = []
+        for word in sorted(shelf):
+            cards.extend(verbs.make_cards(shelf[word], None))
+        repeat = max(1, args.repeat / count)
+        group = min(timeit.repeat(lambda: verbs.group_cards(cards),
+                                  number=1, repeat=repeat))
+
+        verbs.SHELF = shelf
+        verbs.WORDS = sorted(shelf)
+        cwd = os.getcwd()
+        tmp = tempfile.mkdtemp()
+        os.chdir(tmp)
+        try:
+            output = min(timeit.repeat(lambda: verbs.output_cards(),
+                                       number=1, repeat=repeat))
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(tmp)
+        print '%8d %10d %12.1f %14.3f %14.3f' % (
+            count, len(cards), group * 1000, group * 1e6 / len(cards),
+            output * 1e6 / len(cards))
+
+
+class BuiltAnswers(object):
+    # Stands in for verbs.ANSWERS, building each label on every lookup as
+    # make_cards used to before the table
+    def __getitem__(self, path):
+        if len(path) == 6:
+            return verbs.make_participle_answer(*path).encode('utf-8')
+        return verbs.make_answer(*path)
+
+
+def bench_answers(args):
+    verbs.load_card_tables()
+    built = BuiltAnswers()
+    for path, answer in verbs.ANSWERS.iteritems():
+        if built[path] != answer:
+            raise Exception('Answer table disagrees at ' + repr(path))
+    print 'ANSWERS matches make_answer on %d labels' % len(verbs.ANSWERS)
+
+    luo = synthetic_verbs(1)['λύω0']
+    table = verbs.ANSWERS
+    cards = len(nested_make_cards(luo, None))
+    times = []
+    for answers in [built, table]:
+        verbs.ANSWERS = answers
+        try:
+            times.append(min(timeit.repeat(
+                lambda: nested_make_cards(luo, None), number=1,
+                repeat=args.repeat)))
+        finally:
+            verbs.ANSWERS = table
+    print 'nested_make_cards, %d cards' % cards
+    print 'labels built per card: %8.3f us/card' % (times[0] * 1e6 / cards)
+    print 'labels from ANSWERS:   %8.3f us/card (%.1fx)' % \
+        (times[1] * 1e6 / cards, times[0] / times[1])
+
+
+def nested_make_cards(word, tenses):
+    # make_cards as it was before VerbParadigm, walking the nested dicts
+    verbs.load_card_tables()
+    cards = []
+    mytenses = verbs.tense_list(tenses)
+    for vv in verbs.VOICE:
+        for mm in verbs.MOOD:
+            if mm not in word[vv]:
+                continue
+            for tt in mytenses:
+                forms = word[vv][mm]
+                if not forms.get(tt):
+                    continue
+                if mm == 'participle':
+                    for nn in verbs.NUMBER:
+                        for cc in verbs.CASE:
+                            for gg in verbs.GENDER:
+                                answer = verbs.ANSWERS[vv, mm, tt, nn, cc, gg]
+                                for form in verbs.all_words(
+                                        forms[tt][nn][cc][gg]):
+                                    cards.append([form, answer])
+                elif mm == 'infinitive':
+                    for form in verbs.all_words(forms[tt]):
+                        cards.append([forms[tt], verbs.ANSWERS[vv, mm, tt]])
+                else:
+                    for pp in verbs.PERSON:
+                        for form in verbs.all_words(forms[tt][pp]):
+                            cards.append([form,
+                                          verbs.ANSWERS[vv, mm, tt, pp]])
+    return cards
+
+
+def deep_size(obj, seen=None):
+    # Bytes held by obj and everything it refers to, each object once
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.iteritems():
+            size += deep_size(key, seen) + deep_size(value, seen)
+    elif isinstance(obj, (list, tuple)):
+        for item in obj:
+            size += deep_size(item, seen)
+    elif isinstance(obj, verbs.VerbParadigm):
+        for name in verbs.VerbParadigm.__slots__:
+            size += deep_size(getattr(obj, name), seen)
+    return size
+
+
+def bench_paradigms(args):
+    shelf = synthetic_verbs(100)
+    nested = [shelf[word] for word in sorted(shelf)]
+    compact = map(verbs.VerbParadigm, nested)
+    for word, paradigm in zip(nested, compact):
+        if nested_make_cards(word, None) != list(verbs.make_cards(paradigm,
+                                                                  None)):
+            raise Exception('VerbParadigm cards differ from nested dicts')
+    print 'VerbParadigm cards match the nested dicts for %d verbs' % \
+        len(nested)
+
+    print '%-14s %10s %10s' % ('', 'nested', 'compact')
+    print '%-14s %10d %10d' % ('bytes/verb', deep_size(nested) / len(nested),
+                               deep_size(compact) / len(compact))
+    print '%-14s %10d %10d' % ('objects/verb', count_objects(nested[0]),
+                               count_objects(compact[0]))
+
+    cards = sum(len(nested_make_cards(word, None)) for word in nested)
+    times = []
+    for make, paradigms in [(nested_make_cards, nested),
+                            (verbs.make_cards, nested),
+                            (verbs.make_cards, compact)]:
+        times.append(min(timeit.repeat(
+            lambda: [list(make(word, None)) for word in paradigms],
+            number=1, repeat=args.repeat)))
+    print 'make_cards over nested dicts: %8.3f us/card' % \
+        (times[0] * 1e6 / cards)
+    print 'make_cards, dicts converted:  %8.3f us/card' % \
+        (times[1] * 1e6 / cards)
+    print 'make_cards over VerbParadigm: %8.3f us/card (%.1fx)' % \
+        (times[2] * 1e6 / cards, times[0] / times[2])
+
+
+def count_objects(obj, seen=None):
+    # Containers reachable from obj, each once
+    if seen is None:
+        seen = set()
+    if id(obj) in seen or isinstance(obj, basestring):
+        return 0
+    seen.add(id(obj))
+    count = 1
+    if isinstance(obj, dict):
+        for value in obj.itervalues():
+            count += count_objects(value, seen)
+    elif isinstance(obj, (list, tuple)):
+        for item in obj:
+            count += count_objects(item, seen)
+    elif isinstance(obj, verbs.VerbParadigm):
+        for name in verbs.VerbParadigm.__slots__:
+            count += count_objects(getattr(obj, name), seen)
+    return count
+
+
+def synthetic_nouns(count):
+    # count copies of each noun in prepare_shelf, renamed and renumbered
+    nouns.SHELF = {}
+    nouns.prepare_shelf()
+    words = sorted(nouns.SHELF.keys())
+    shelf = {}
+    for ii in range(count):
+        word = words[ii % len(words)]
+        shelf[word + '%d' % ii] = renumber(copy.deepcopy(nouns.SHELF[word]),
+                                           u'%d' % ii)
+    return shelf
+
+
+def flat_forms(node):
+    forms = []
+    for key, value in sorted(node.items()):
+        if isinstance(value, dict):
+            forms.extend(flat_forms(value))
+        elif key != 'gender':
+            forms.append(value)
+    return forms
+
+
+def in_tmpdir(func):
+    def run():
+        cwd = os.getcwd()
+        tmp = tempfile.mkdtemp()
+        os.chdir(tmp)
+        try:
+            return func()
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(tmp)
+    return run
+
+
+# Each case_ function sets up a stage and returns a function running it,
+# how many units it handles and what they are
+
+def case_noun_parse(args):
+    pages = noun_fixtures(args.padding)
+    forms = sum(len(flat_forms(nouns.get_noun_forms(page))) for page in pages)
+    return lambda: map(nouns.get_noun_forms, pages), forms, 'forms'
+
+
+def case_noun_forms(args):
+    forms = []
+    for paradigm in synthetic_nouns(args.size).values():
+        forms.extend(flat_forms(paradigm))
+    return (lambda: [nouns.min_form(nouns.clean_form(form))
+                     for form in forms], len(forms), 'forms')
+
+
+def case_noun_defs(args):
+    nouns.SHELF = synthetic_nouns(args.size)
+    words = sorted(nouns.SHELF.keys())
+    cards = sum(len(lines) for word in words
+                for lines in nouns.word_defs(word))
+    return lambda: map(nouns.word_defs, words), cards, 'cards'
+
+
+def case_noun_files(args):
+    func, cards, unit = case_noun_defs(args)
+    words = sorted(nouns.SHELF.keys())
+    return in_tmpdir(lambda: nouns.create_noun_files(words)), cards, unit
+
+
+def case_verb_set_forms(args):
+    verbs.SHELF = {}
+    verbs.prepare_shelf()
+    forms = len(flat_forms(verbs.SHELF['λύω']))
+
+    def prepare():
+        verbs.SHELF = {}
+        verbs.prepare_shelf()
+    return prepare, forms, 'forms'
+
+
+def case_verb_make_cards(args):
+    paradigms = synthetic_verbs(args.size).values()
+    cards = sum(len(list(verbs.make_cards(word, None)))
+                for word in paradigms)
+    return (lambda: [list(verbs.make_cards(word, None))
+                     for word in paradigms], cards, 'cards')
+
+
+def case_verb_output(args):
+    func, cards, unit = case_verb_make_cards(args)
+    verbs.SHELF = synthetic_verbs(args.size)
+    verbs.WORDS = sorted(verbs.SHELF.keys())
+    return in_tmpdir(verbs.output_cards), cards, unit
+
+
+def peak_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_case(name, args):
+    # Runs in a forked child, so that the peak memory is this case's alone:
+    # the growth of the high-water mark over one run, after the setup
+    func, units, unit = globals()['case_' + name](args)
+    before = peak_kb()
+    func()
+    peak = peak_kb() - before
+    best = min(timeit.repeat(func, number=1, repeat=args.repeat))
+    return {'units': units, 'unit': unit, 'seconds': best,
+            'throughput': units / best, 'peak_kb': peak}
+
+
+def measure(name, args):
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read)
+        status = 1
+        try:
+            os.write(write, json.dumps(run_case(name, args)))
+            status = 0
+        finally:
+            os._exit(status)
+    os.close(write)
+    chunks = []
+    while True:
+        chunk = os.read(read, 65536)
+        if not chunk:
+            break
+        chunks.append(chunk)
+    os.close(read)
+    pid, status = os.waitpid(pid, 0)
+    if status:
+        raise Exception('Benchmark case failed: ' + name)
+    return json.loads(''.join(chunks))
+
+
+def bench_suite(args):
+    started = time.time()
+    results = {}
+    print '%-16s %18s %12s %12s' % ('stage', 'throughput', 'peak', 'best')
+    for name in SUITE:
+        result = measure(name, args)
+        results[name] = result
+        print '%-16s %10.0f %-7s %9d KB %9.2f ms' % (
+            name, result['throughput'], result['unit'] + '/s',
+            result['peak_kb'], result['seconds'] * 1000)
+    print 'suite took %.1f s' % (time.time() - started)
+    report = {'size': args.size, 'padding': args.padding,
+              'repeat': args.repeat, 'results': results}
+    if args.save:
+        anki.save_json(args.save, report)
+        print 'Saved baseline to ' + args.save
+    if args.compare:
+        return compare_baseline(report, anki.load_json(args.compare),
+                                args.tolerance)
+    return False
+
+
+def compare_baseline(report, baseline, tolerance):
+    # Returns True if any stage got slower or bigger than allowed
+    if not baseline:
+        raise Exception('No baseline to compare against')
+    if baseline['size'] != report['size']:
+        print 'Baseline was taken with --size %d' % baseline['size']
+    failed = False
+    for name in SUITE:
+        old = baseline['results'].get(name)
+        if not old:
+            continue
+        new = report['results'][name]
+        speed = new['throughput'] / old['throughput']
+        problems = []
+        if speed < 1 - tolerance:
+            problems.append('%.0f%% slower' % ((1 - speed) * 100))
+        # A few MB either way is allocator noise, not a regression
+        if new['peak_kb'] > max(old['peak_kb'] * (1 + tolerance),
+                                old['peak_kb'] + 4096):
+            problems.append('peak %d KB, was %d KB' % (new['peak_kb'],
+                                                      old['peak_kb']))
+        if problems:
+            failed = True
+            print 'REGRESSION %s: %s' % (name, ', '.join(problems))
+        else:
+            print 'ok %s: %.2fx the baseline throughput' % (name, speed)
+    return failed
+
+
+def run_command(command, **environ):
+    # Seconds to run one of the STARTUP commands to completion
+    script = os.path.join(paradigmdata.HERE, command[0])
+    env = dict(os.environ, PYTHONIOENCODING='utf-8', **environ)
+    with open(os.devnull, 'w') as devnull:
+        started = time.time()
+        subprocess.check_call([sys.executable, script] + command[1:],
+                              stdout=devnull, env=env)
+        return time.time() - started
+
+
+def bench_hashseed(args):
+    # Builds the verb decks from the curated paradigms under each of
+    # HASH_SEEDS, in memory, streamed and in a pool, and fails unless every
+    # build writes the same files: nothing in them may follow dict order
+    @in_tmpdir
+    def run():
+        outputs = {}
+        for seed in HASH_SEEDS:
+            for command in HASH_SEED_BUILDS:
+                run_command(command, PYTHONHASHSEED=seed)
+                files = []
+                for filename in HASH_SEED_FILES:
+                    with open(filename, 'rb') as ff:
+                        files.append(ff.read())
+                outputs.setdefault(tuple(files), []).append(
+                    'PYTHONHASHSEED=%s %s' % (seed, ' '.join(command[3:])))
+        if len(outputs) == 1:
+            print '%d builds under %d hash seeds wrote the same decks' % (
+                len(HASH_SEEDS) * len(HASH_SEED_BUILDS), len(HASH_SEEDS))
+            return False
+        print 'Builds wrote %d different sets of decks:' % len(outputs)
+        for builds in sorted(outputs.values()):
+            print '  ' + ', '.join(builds)
+        return True
+    return run()
+
+
+def bench_startup(args):
+    # Times short commands end to end against STARTUP_TARGET. The first run
+    # compiles curated.dat, the rest find it built.
+    @in_tmpdir
+    def run():
+        shelf = ParadigmStore('nouns.db', 'noun', nouns.surface_forms)
+        paradigmdata.install('noun', shelf)
+        shelf.close()
+        print 'first --get, compiling %s: %.0f ms' % (
+            paradigmdata.CURATED_FILE, run_command(STARTUP[2]) * 1000)
+        failed = False
+        for command in STARTUP:
+            runs = sorted(run_command(command)
+                          for ii in range(max(1, args.repeat)))
+            median = runs[len(runs) / 2]
+            ok = median <= STARTUP_TARGET
+            failed = failed or not ok
+            print '%-26s %7.0f ms %s' % (' '.join(command), median * 1000,
+                                         'ok' if ok else 'OVER TARGET')
+        print 'target %.0f ms, median of %d runs' % (
+            STARTUP_TARGET * 1000, max(1, args.repeat))
+        return failed
+    return run()
+
+
+class PageServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    # Serves canned Wiktionary pages by lemma on a free local port, each
+    # after a delay like the network's, and 404 for any other
+    daemon_threads = True
+    # Room for every fetch thread's connection at once
+    request_queue_size = 64
+
+    def __init__(self, pages, latency):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0),
+                                           PageHandler)
+        self.pages = pages
+        self.latency = latency
+
+    def url(self):
+        return 'http://127.0.0.1:%d/wiki/' % self.server_address[1]
+
+
+class PageHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        page = self.server.pages.get(urllib.unquote(self.path.split('/')[-1]))
+        self.send_response(200 if page else 404)
+        self.send_header('Content-Length', str(len(page or '')))
+        self.end_headers()
+        self.wfile.write(page or '')
+
+    def log_message(self, format, *args):
+        pass
+
+
+def read_build(words, jobs):
+    # Seconds create_noun_files takes over words from an empty shelf, and
+    # the files it writes, with the Called for lines it prints kept quiet
+    outputs = {}
+
+    def build():
+        nouns.SHELF = {}
+        nouns.create_noun_files(words, jobs)
+        for filename in [anki.NOUNS_FILE, anki.NOUNS_REVERSE,
+                         anki.NOUNS_MANIFEST]:
+            with open(filename, 'rb') as ff:
+                outputs[filename] = ff.read()
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        started = time.time()
+        in_tmpdir(build)()
+        elapsed = time.time() - started
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    return elapsed, outputs
+
+
+def bench_prefetch(args):
+    # Downloads synthetic nouns from a local server with one fetch thread
+    # and with --jobs, and fails unless both write the same files. One word
+    # has no page, so the failed fetch is compared too.
+    shelf = synthetic_nouns(args.size)
+    pages = dict((word.split(' ')[-1], noun_page(word, shelf[word], 10))
+                 for word in shelf)
+    words = sorted(shelf) + ['ὁ ἀπών']
+    server = PageServer(pages, args.latency)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    wiktionary = anki.WIKTIONARY
+    anki.WIKTIONARY = server.url()
+    try:
+        results = [read_build(words, jobs) for jobs in [1, args.jobs]]
+    finally:
+        anki.WIKTIONARY = wiktionary
+        server.shutdown()
+        server.server_close()
+    (serial, expected), (threaded, outputs) = results
+    print '%d words, %.0f ms a page' % (len(words), args.latency * 1000)
+    print '%-10s %8.2f s' % ('--jobs 1:', serial)
+    print '%-10s %8.2f s (%.1fx)' % ('--jobs %d:' % args.jobs, threaded,
+                                      serial / threaded)
+    failed = False
+    for filename in sorted(expected):
+        same = outputs[filename] == expected[filename]
+        failed = failed or not same
+        print '%-18s %s' % (filename, 'same' if same else 'DIFFERS')
+    return failed
+
+
+def bench_declension(args):
+    # Declines the curated nouns from their nominative and genitive, and
+    # fails if that no longer gives their forms
+    lexicon = declension.curated_lexicon()
+    started = time.time()
+    for ii in range(args.repeat):
+        for word, nominative, genitive, gender, number, paradigm in lexicon:
+            declension.decline(nominative, genitive, gender, number)
+    elapsed = time.time() - started
+    count = len(lexicon) * args.repeat
+    print '%d lemmas: %.3f ms/lemma, %.0f lemmas/s' % (
+        len(lexicon), elapsed * 1000 / count, count / elapsed)
+    return declension.check() > 0
+
+
+def bench_conjugation(args):
+    # Conjugates λύω from its principal parts, and fails if that no longer
+    # gives prepare_shelf's forms
+    started = time.time()
+    for ii in range(args.repeat):
+        verbs.conjugate(conjugation.LUO_PARTS)
+    elapsed = time.time() - started
+    print 'λύω: %.1f ms/verb, %.0f verbs/s' % (
+        elapsed * 1000 / args.repeat, args.repeat / elapsed)
+    return conjugation.check() > 0
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,598 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import sys
+import unicodedata
+
+import declension
+from declension import letters, make_form, plain, unaccented
+
+# The principal parts, in the order they are given
+PARTS = ['present', 'future', 'aorist', 'perfect', 'perfect middle',
+         'aorist passive']
+# λύω's, from which conjugate should give prepare_shelf's forms
+LUO_PARTS = ['λύ̄ω', 'λύ̄σω', 'ἔλῡσα', 'λέλυκα', 'λέλυμαι', 'ἐλύθην']
+# A deponent, which has no active, for check() to take through to cards
+DEPONENT_PARTS = ['βούλομαι', 'βουλήσομαι', '-', '-', 'βεβούλημαι',
+                  'ἐβουλήθην']
+SMOOTH = u'\u0313'
+ROUGH = u'\u0314'
+LENGTHS = declension.MACRON + declension.BREVE
+AUGMENTS = {u'α': u'η', u'ε': u'η', u'ο': u'ω', u'ι': u'ῑ', u'υ': u'ῡ',
+            u'αι': u'ῃ', u'ει': u'ῃ', u'οι': u'ῳ', u'αυ': u'ηυ',
+            u'ευ': u'ηυ', u'ου': u'ου'}
+
+# Endings of the eight persons, in verbs.PERSON order. None is a person
+# the mood lacks; a list gives alternatives.
+ACTIVE = [u'ω', u'εις', u'ει', u'ετον', u'ετον', u'ομεν', u'ετε', u'ουσι']
+ACTIVE_PAST = [u'ον', u'ες', u'ε', u'ετον', u'ετην', u'ομεν', u'ετε', u'ον']
+ACTIVE_SUBJUNCTIVE = [u'ω', u'ῃς', u'ῃ', u'ητον', u'ητον', u'ωμεν', u'ητε',
+                      u'ωσι']
+ACTIVE_OPTATIVE = [u'οιμι', u'οις', u'οι', u'οιτον', u'οιτην', u'οιμεν',
+                   u'οιτε', u'οιεν']
+ACTIVE_IMPERATIVE = [None, u'ε', u'ετω', u'ετον', u'ετων', None, u'ετε',
+                     u'οντων']
+MIDDLE = [u'ομαι', [u'ῃ', u'ει'], u'εται', u'εσθον', u'εσθον', u'ομεθα',
+          u'εσθε', u'ονται']
+MIDDLE_PAST = [u'ομην', u'ου', u'ετο', u'εσθον', u'εσθην', u'ομεθα', u'εσθε',
+               u'οντο']
+MIDDLE_SUBJUNCTIVE = [u'ωμαι', u'ῃ', u'ηται', u'ησθον', u'ησθον', u'ωμεθα',
+                      u'ησθε', u'ωνται']
+MIDDLE_OPTATIVE = [u'οιμην', u'οιο', u'οιτο', u'οισθον', u'οισθην',
+                   u'οιμεθα', u'οισθε', u'οιντο']
+MIDDLE_IMPERATIVE = [None, u'ου', u'εσθω', u'εσθον', u'εσθων', None, u'εσθε',
+                     u'εσθων']
+AORIST = [u'α', u'ας', u'ε', u'ατον', u'ατην', u'αμεν', u'ατε', u'αν']
+AORIST_OPTATIVE = [u'αιμι', [u'αις', u'ειας'], [u'αι', u'ειε'], u'αιτον',
+                   u'αιτην', u'αιμεν', u'αιτε', [u'αιεν', u'ειαν']]
+AORIST_IMPERATIVE = [None, u'ον', u'ατω', u'ατον', u'ατων', None, u'ατε',
+                     u'αντων']
+AORIST_MIDDLE = [u'αμην', u'ω', u'ατο', u'ασθον', u'ασθην', u'αμεθα',
+                 u'ασθε', u'αντο']
+AORIST_MIDDLE_OPTATIVE = [u'αιμην', u'αιο', u'αιτο', u'αισθον', u'αισθην',
+                          u'αιμεθα', u'αισθε', u'αιντο']
+AORIST_MIDDLE_IMPERATIVE = [None, u'αι', u'ασθω', u'ασθον', u'ασθων', None,
+                            u'ασθε', u'ασθων']
+SECOND_AORIST_MIDDLE_IMPERATIVE = [None, u'οῦ', u'εσθω', u'εσθον', u'εσθων',
+                                   None, u'εσθε', u'εσθων']
+PERFECT = [u'α', u'ας', u'ε', u'ατον', u'ατον', u'αμεν', u'ατε', u'ᾱσι']
+PERFECT_OPTATIVE = [[u'οιμι', u'οίην'], [u'οις', u'οίης'], [u'οι', u'οίη'],
+                    u'οιτον', u'οιτην', u'οιμεν', u'οιτε', u'οιεν']
+PERFECT_IMPERATIVE = [None, u'ε', u'ετω', u'ετον', u'ετων', None, u'ετε',
+                      None]
+PLUPERFECT = [u'η', u'ης', u'ει(ν)', u'ετον', u'ετην', u'εμεν', u'ετε',
+              u'εσαν']
+PERFECT_MIDDLE = [u'μαι', u'σαι', u'ται', u'σθον', u'σθον', u'μεθα', u'σθε',
+                  u'νται']
+PERFECT_MIDDLE_IMPERATIVE = [None, u'σο', u'σθω', u'σθον', u'σθων', None,
+                             u'σθε', u'σθων']
+PLUPERFECT_MIDDLE = [u'μην', u'σο', u'το', u'σθον', u'σθην', u'μεθα', u'σθε',
+                     u'ντο']
+AORIST_PASSIVE = [u'ην', u'ης', u'η', u'ητον', u'ητην', u'ημεν', u'ητε',
+                  u'ησαν']
+AORIST_PASSIVE_SUBJUNCTIVE = [u'ῶ', u'ῇς', u'ῇ', u'ῆτον', u'ῆτον', u'ῶμεν',
+                              u'ῆτε', u'ῶσι']
+AORIST_PASSIVE_OPTATIVE = [u'είην', u'είης', u'είη', [u'εῖτον', u'είητον'],
+                           [u'είτην', u'ειήτην'], [u'εῖμεν', u'είημεν'],
+                           [u'εῖτε', u'είητε'], [u'εῖεν', u'είησαν']]
+AORIST_PASSIVE_IMPERATIVE = [None, u'ητι', u'ητω', u'ητον', u'ητων', None,
+                             u'ητε', u'εντων']
+# εἰμί, after a participle in the perfect's compound forms
+EIMI_SUBJUNCTIVE = [u'ὦ', u'ᾖς', u'ᾖ', u'ἦτον', u'ἦτον', u'ὦμεν', u'ἦτε',
+                    u'ὦσι']
+EIMI_OPTATIVE = [u'εἴην', u'εἴης', u'εἴη', [u'εἴητον', u'εἶτον'],
+                 [u'εἰήτην', u'εἴτην'], [u'εἴημεν', u'εἶμεν'],
+                 [u'εἴητε', u'εἶτε'], [u'εἴησαν', u'εἶεν']]
+EIMI_IMPERATIVE = [None, u'ἴσθι', u'ἔστω', u'ἔστον', u'ἔστων', None, u'ἐστέ',
+                   u'ὄντων']
+
+# Participle endings as set_verb_form takes them: masculine, feminine and
+# neuter for each case it is given
+PARTICIPLE = [[u'ων', u'ουσα', u'ον'], [u'οντος', u'ουσης', u'οντος'],
+              [u'οντι', u'ουσῃ', u'οντι'], [u'οντα', u'ουσαν', u'ον'],
+              [u'ων', u'ουσα', u'ον'], [u'οντε', u'ουσᾱ', u'οντε'],
+              [u'οντοιν', u'ουσαιν', u'οντοιν'],
+              [u'οντες', u'ουσαι', u'οντα'], [u'οντων', u'ουσῶν', u'οντων'],
+              [u'ουσι(ν)', u'ουσαις', u'ουσι(ν)'],
+              [u'οντας', u'ουσᾱς', u'οντα']]
+AORIST_PARTICIPLE = [[u'ᾱς', u'ᾱσα', u'αν'], [u'αντος', u'ᾱσης', u'αντος'],
+                     [u'αντι', u'ᾱσῃ', u'αντι'], [u'αντα', u'ᾱσαν', u'αν'],
+                     [u'ᾱς', u'ᾱσα', u'αν'], [u'αντε', u'ᾱσᾱ', u'αντε'],
+                     [u'αντοιν', u'ᾱσαιν', u'αντοιν'],
+                     [u'αντες', u'ᾱσαι', u'αντα'],
+                     [u'αντων', u'ᾱσῶν', u'αντων'],
+                     [u'ᾱσι(ν)', u'ᾱσαις', u'ᾱσι(ν)'],
+                     [u'αντας', u'ᾱσᾱς', u'αντα']]
+PERFECT_PARTICIPLE = [[u'ώς', u'υῖα', u'ός'], [u'ότος', u'υίᾱς', u'ότος'],
+                      [u'ότι', u'υίᾳ', u'ότι'], [u'ότα', u'υῖαν', u'ός'],
+                      [u'ώς', u'υῖα', u'ός'], [u'ότε', u'υίᾱ', u'ότε'],
+                      [u'ότοιν', u'υίαιν', u'ότοιν'],
+                      [u'ότες', u'υῖαι', u'ότα'], [u'ότων', u'υιῶν', u'ότων'],
+                      [u'όσι(ν)', u'υίαις', u'όσι(ν)'],
+                      [u'ότας', u'υίᾱς', u'ότα']]
+AORIST_PASSIVE_PARTICIPLE = [[u'είς', u'εῖσα', u'έν'],
+                             [u'έντος', u'είσης', u'έντος'],
+                             [u'έντι', u'είσῃ', u'έντι'],
+                             [u'έντα', u'εῖσαν', u'έν'],
+                             [u'είς', u'εῖσα', u'έν'],
+                             [u'έντε', u'είσᾱ', u'έντε'],
+                             [u'έντοιν', u'είσαιν', u'έντοιν'],
+                             [u'έντες', u'εῖσαι', u'έντα'],
+                             [u'έντων', u'εισῶν', u'έντων'],
+                             [u'εῖσι(ν)', u'είσαις', u'εῖσι(ν)'],
+                             [u'έντας', u'είσᾱς', u'έντα']]
+# After the ο of the present, the α of the first aorist or nothing in the
+# perfect
+MIDDLE_PARTICIPLE = [[u'μενος', u'μενη', u'μενον'],
+                     [u'μενου', u'μενης', u'μενου'],
+                     [u'μενῳ', u'μενῃ', u'μενῳ'],
+                     [u'μενον', u'μενην', u'μενον'],
+                     [u'μενε', u'μενη', u'μενον'],
+                     [u'μενω', u'μενᾱ', u'μενω'],
+                     [u'μενοιν', u'μεναιν', u'μενοιν'],
+                     [u'μενοι', u'μεναι', u'μενα'],
+                     [u'μενων', u'μενων', u'μενων'],
+                     [u'μενοις', u'μεναις', u'μενοις'],
+                     [u'μενους', u'μενᾱς', u'μενα']]
+
+
+def main():
+    args = parse_args()
+    if args.check:
+        sys.exit(1 if check() else 0)
+    if args.parts:
+        show(conjugate(args.parts))
+    if args.principal_parts:
+        for word, parts in read_principal_parts(args.principal_parts):
+            print word
+            show(conjugate(parts))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser('Conjugation')
+    parser.add_argument('parts', nargs='*',
+                        help="principal parts, as in λύ̄ω λύ̄σω ἔλῡσα "
+                        "λέλυκα λέλυμαι ἐλύθην; - for one that is missing")
+    parser.add_argument('--principal-parts', metavar='FILE',
+                        help="conjugate every verb in FILE")
+    parser.add_argument('--check', action='store_true',
+                        help="compare the forms made from λύω's principal "
+                        "parts with the ones in prepare_shelf")
+    return parser.parse_args()
+
+
+def show(blocks):
+    for key in sorted(blocks):
+        forms = blocks[key]
+        if key[1] == 'participle':
+            forms = ['/'.join(row) for row in forms]
+        elif key[1] != 'infinitive':
+            forms = [form or '-' for form in forms]
+        if isinstance(forms, list):
+            forms = ', '.join(forms)
+        print ' '.join(key) + ': ' + forms
+
+
+def text(form):
+    # A form as prepare_shelf types it: NFC, with an accent before the
+    # macron or breve of the same vowel, which a circumflex replaces
+    output = []
+    for char in unicodedata.normalize('NFD', form):
+        if char == declension.CIRCUMFLEX and output and output[-1] in LENGTHS:
+            output[-1] = char
+        elif (char in declension.ACCENTS and output and
+                output[-1] in LENGTHS):
+            output.insert(len(output) - 1, char)
+        else:
+            output.append(char)
+    return unicodedata.normalize('NFC', u''.join(output)).encode('utf-8')
+
+
+def ending_of(lets, endings):
+    # The principal part's ending out of endings, or None
+    word = plain(lets)
+    for ending in endings:
+        if word.endswith(ending):
+            return ending
+    return None
+
+
+def breathing(lets):
+    return u''.join(mark for base, marks in lets[:2]
+                    for mark in marks if mark in SMOOTH + ROUGH)
+
+
+def initial(lets):
+    # The letters of a stem before its first consonant
+    count = 0
+    while (count < len(lets) and
+           lets[count][0].lower() in declension.VOWELS):
+        count += 1
+    return lets[:count]
+
+
+def augment(stem):
+    # ἐ before a consonant, or the first vowel lengthened: ἀκου- ἠκου-
+    head = initial(stem)
+    if not head:
+        return [[u'ε', SMOOTH]] + stem
+    rest = stem[len(head):]
+    key = plain(head)
+    for size in [2, 1]:
+        if key[:size] in AUGMENTS:
+            new = letters(AUGMENTS[key[:size]])
+            new[-1][1] += breathing(head)
+            return new + head[size:] + rest
+    return stem
+
+
+def unaugment(lets, present):
+    # An augmented principal part without its augment, from how the
+    # present's stem would be augmented
+    old = initial(present)
+    new = initial(augment(present))
+    if plain(lets[:len(new)]) == plain(new) and lets[len(new):]:
+        return [list(letter) for letter in old] + lets[len(new):]
+    return lets
+
+
+def persons(stem, endings, optative=False):
+    # Recessive forms for the eight persons
+    return [u'' if ending is None else
+            make_form(stem, ending, 0, optative=optative)
+            for ending in endings]
+
+
+def participle(stem, table, target=None):
+    # Participles keep the accent of the masculine nominative singular,
+    # which is recessive unless a target is given
+    if target is None:
+        target = declension.accent_of(letters(make_form(stem, table[0][0],
+                                                        0)))[0]
+    return [[make_form(stem, ending, target) for ending in row]
+            for row in table]
+
+
+def prefixed(vowel, table):
+    return [[vowel + ending for ending in row] for row in table]
+
+
+def periphrastic(table, eimi, simple=None):
+    # The participle's masculine nominative of each number with εἰμί, then
+    # any simple form: λελυκὼς ὦ / λελύκω
+    subjects = [table[0][0]] * 3 + [table[5][0]] * 2 + [table[7][0]] * 3
+    forms = []
+    for ii, alternatives in enumerate(eimi):
+        if alternatives is None:
+            forms.append(u'')
+            continue
+        if not isinstance(alternatives, list):
+            alternatives = [alternatives]
+        subject = grave(subjects[ii])
+        output = [subject + u' ' + form for form in alternatives]
+        if simple and simple[ii]:
+            output.append(simple[ii])
+        forms.append(u' / '.join(output))
+    return forms
+
+
+def grave(form):
+    # A final acute becomes grave before another word
+    lets = letters(form)
+    nucs = declension.nuclei(lets)
+    idx, accent = declension.accent_of(lets)
+    if idx == len(nucs) - 1 and accent == declension.ACUTE:
+        carrier = nucs[idx][0]
+        lets[carrier][1] = lets[carrier][1].replace(declension.ACUTE,
+                                                    declension.GRAVE)
+    return declension.to_text(lets)
+
+
+def conjugate(parts):
+    # A verb's forms from its principal parts, as {(voice, mood, tense):
+    # forms} with the forms laid out as set_verb_form takes them. A part
+    # given as None or '-' is left out with the tenses made from it.
+    # Mark long α, ι and υ with a macron where the accent depends on them.
+    parts = [part.decode('utf-8') if isinstance(part, str) else part
+             for part in parts]
+    parts = [letters(part) if part and part != u'-' else None
+             for part in parts]
+    parts += [None] * (len(PARTS) - len(parts))
+    present, future, aorist, perfect, perfect_middle, aorist_passive = parts
+    if not present:
+        raise Exception('A verb needs its present')
+    blocks = {}
+    ending = present_system(blocks, present)
+    stem = unaccented(present[:-len(ending)])
+    if future:
+        idx, accent = declension.accent_of(future)
+        if idx == len(declension.nuclei(future)) - 1:
+            raise Exception('Contracted futures are not made: ' +
+                            declension.to_text(future).encode('utf-8'))
+        future_system(blocks, unaccented(future))
+    if aorist:
+        aorist_system(blocks, unaugment(unaccented(aorist), stem))
+    if perfect:
+        perfect_system(blocks, unaccented(perfect))
+    if perfect_middle:
+        perfect_middle_system(blocks, unaccented(perfect_middle))
+        if future:
+            future_perfect_system(blocks, unaccented(perfect_middle),
+                                  stem, unaccented(future))
+    if aorist_passive:
+        aorist_passive_system(blocks,
+                              unaugment(unaccented(aorist_passive), stem))
+    for key, forms in blocks.items():
+        if key[1] == 'infinitive':
+            blocks[key] = text(forms)
+        elif key[1] == 'participle':
+            blocks[key] = [[text(form) for form in row] for row in forms]
+        else:
+            blocks[key] = [text(form) for form in forms]
+    return blocks
+
+
+def present_system(blocks, present):
+    # Returns the ending, so that the stem can be found from the present
+    ending = ending_of(present, [u'ομαι', u'ω'])
+    if not ending:
+        raise Exception('Not a thematic present: ' +
+                        declension.to_text(present).encode('utf-8'))
+    stem = unaccented(present[:-len(ending)])
+    past = augment(stem)
+    if ending == u'ω':
+        blocks['active', 'indicative', 'present'] = persons(stem, ACTIVE)
+        blocks['active', 'indicative', 'imperfect'] = persons(past,
+                                                               ACTIVE_PAST)
+        blocks['active', 'subjunctive', 'present'] = persons(
+            stem, ACTIVE_SUBJUNCTIVE)
+        blocks['active', 'optative', 'present'] = persons(
+            stem, ACTIVE_OPTATIVE, True)
+        blocks['active', 'imperative', 'present'] = persons(
+            stem, ACTIVE_IMPERATIVE)
+        blocks['active', 'infinitive', 'present'] = make_form(stem, u'ειν',
+                                                              0)
+        blocks['active', 'participle', 'present'] = participle(stem,
+                                                               PARTICIPLE)
+    blocks['middle', 'indicative', 'present'] = persons(stem, MIDDLE)
+    blocks['middle', 'indicative', 'imperfect'] = persons(past, MIDDLE_PAST)
+    blocks['middle', 'subjunctive', 'present'] = persons(stem,
+                                                         MIDDLE_SUBJUNCTIVE)
+    blocks['middle', 'optative', 'present'] = persons(stem, MIDDLE_OPTATIVE,
+                                                      True)
+    blocks['middle', 'imperative', 'present'] = persons(stem,
+                                                        MIDDLE_IMPERATIVE)
+    blocks['middle', 'infinitive', 'present'] = make_form(stem, u'εσθαι', 0)
+    blocks['middle', 'participle', 'present'] = participle(
+        stem, prefixed(u'ο', MIDDLE_PARTICIPLE))
+    return ending
+
+
+def future_system(blocks, future, voice=None, tense='future'):
+    # The active and middle future, or with a voice just that voice's
+    ending = ending_of(future, [u'ομαι', u'ω'])
+    if not ending:
+        raise Exception('Not a future in -ω or -ομαι: ' +
+                        declension.to_text(future).encode('utf-8'))
+    stem = unaccented(future[:-len(ending)])
+    if ending == u'ω' and not voice:
+        blocks['active', 'indicative', tense] = persons(stem, ACTIVE)
+        blocks['active', 'optative', tense] = persons(stem, ACTIVE_OPTATIVE,
+                                                      True)
+        blocks['active', 'infinitive', tense] = make_form(stem, u'ειν', 0)
+        blocks['active', 'participle', tense] = participle(stem, PARTICIPLE)
+    voice = voice or 'middle'
+    blocks[voice, 'indicative', tense] = persons(stem, MIDDLE)
+    blocks[voice, 'optative', tense] = persons(stem, MIDDLE_OPTATIVE, True)
+    blocks[voice, 'infinitive', tense] = make_form(stem, u'εσθαι', 0)
+    blocks[voice, 'participle', tense] = participle(
+        stem, prefixed(u'ο', MIDDLE_PARTICIPLE))
+
+
+def aorist_system(blocks, aorist):
+    # The first aorist in -α or -αμην, the second in -ον or -ομην
+    ending = ending_of(aorist, [u'αμην', u'ομην', u'α', u'ον'])
+    if not ending:
+        raise Exception('Not an aorist in -α or -ον: ' +
+                        declension.to_text(aorist).encode('utf-8'))
+    stem = unaccented(aorist[:-len(ending)])
+    past = augment(stem)
+    first = ending.startswith(u'α')
+    tense = '1st aorist' if first else '2nd aorist'
+    if ending in [u'α', u'ον']:
+        if first:
+            blocks['active', 'indicative', tense] = persons(past, AORIST)
+            blocks['active', 'optative', tense] = persons(
+                stem, AORIST_OPTATIVE, True)
+            blocks['active', 'imperative', tense] = persons(
+                stem, AORIST_IMPERATIVE)
+            # λῦσαι, accented on the penult
+            blocks['active', 'infinitive', tense] = make_form(
+                stem, u'αι', -2, exact=True)
+            blocks['active', 'participle', tense] = participle(
+                stem, AORIST_PARTICIPLE)
+        else:
+            # λιπεῖν, λιπών
+            blocks['active', 'indicative', tense] = persons(past,
+                                                             ACTIVE_PAST)
+            blocks['active', 'optative', tense] = persons(
+                stem, ACTIVE_OPTATIVE, True)
+            blocks['active', 'imperative', tense] = persons(
+                stem, ACTIVE_IMPERATIVE)
+            blocks['active', 'infinitive', tense] = make_form(stem, u'εῖν',
+                                                              0)
+            blocks['active', 'participle', tense] = participle(
+                stem, PARTICIPLE, len(declension.nuclei(stem)))
+        blocks['active', 'subjunctive', tense] = persons(stem,
+                                                         ACTIVE_SUBJUNCTIVE)
+    blocks['middle', 'subjunctive', tense] = persons(stem,
+                                                     MIDDLE_SUBJUNCTIVE)
+    if first:
+        blocks['middle', 'indicative', tense] = persons(past, AORIST_MIDDLE)
+        blocks['middle', 'optative', tense] = persons(
+            stem, AORIST_MIDDLE_OPTATIVE, True)
+        blocks['middle', 'imperative', tense] = persons(
+            stem, AORIST_MIDDLE_IMPERATIVE)
+        blocks['middle', 'infinitive', tense] = make_form(stem, u'ασθαι', 0)
+        blocks['middle', 'participle', tense] = participle(
+            stem, prefixed(u'α', MIDDLE_PARTICIPLE))
+    else:
+        # λιπέσθαι, λιποῦ
+        blocks['middle', 'indicative', tense] = persons(past, MIDDLE_PAST)
+        blocks['middle', 'optative', tense] = persons(stem, MIDDLE_OPTATIVE,
+                                                      True)
+        blocks['middle', 'imperative', tense] = persons(
+            stem, SECOND_AORIST_MIDDLE_IMPERATIVE)
+        blocks['middle', 'infinitive', tense] = make_form(stem, u'έσθαι', 0)
+        blocks['middle', 'participle', tense] = participle(
+            stem, prefixed(u'ο', MIDDLE_PARTICIPLE))
+
+
+def perfect_system(blocks, perfect):
+    if not plain(perfect).endswith(u'α'):
+        raise Exception('Not a perfect in -α: ' +
+                        declension.to_text(perfect).encode('utf-8'))
+    stem = perfect[:-1]
+    if plain(stem).endswith(u'κ'):
+        tense, past_tense = '1st perfect', '1st pluperfect'
+    else:
+        tense, past_tense = '2nd perfect', '2nd pluperfect'
+    participles = participle(stem, PERFECT_PARTICIPLE)
+    blocks['active', 'indicative', tense] = persons(stem, PERFECT)
+    blocks['active', 'indicative', past_tense] = persons(augment(stem),
+                                                         PLUPERFECT)
+    blocks['active', 'subjunctive', tense] = periphrastic(
+        participles, EIMI_SUBJUNCTIVE, persons(stem, ACTIVE_SUBJUNCTIVE))
+    blocks['active', 'optative', tense] = periphrastic(
+        participles, EIMI_OPTATIVE, persons(stem, PERFECT_OPTATIVE, True))
+    blocks['active', 'imperative', tense] = periphrastic(
+        participles, EIMI_IMPERATIVE, persons(stem, PERFECT_IMPERATIVE))
+    blocks['active', 'infinitive', tense] = make_form(stem, u'έναι', 0)
+    blocks['active', 'participle', tense] = participles
+
+
+def perfect_middle_system(blocks, perfect):
+    # Only stems ending in a vowel: after a consonant the endings
+    # assimilate (γέγραμμαι, γέγραψαι) and the third plural is compound
+    stem = perfect[:-3]
+    if (not plain(perfect).endswith(u'μαι') or
+            plain(stem)[-1:] not in declension.VOWELS):
+        raise Exception('Not a perfect middle in a vowel and -μαι: ' +
+                        declension.to_text(perfect).encode('utf-8'))
+    participles = participle(stem, MIDDLE_PARTICIPLE,
+                             len(declension.nuclei(stem)))
+    blocks['middle', 'indicative', 'perfect'] = persons(stem,
+                                                        PERFECT_MIDDLE)
+    blocks['middle', 'indicative', 'pluperfect'] = persons(
+        augment(stem), PLUPERFECT_MIDDLE)
+    blocks['middle', 'subjunctive', 'perfect'] = periphrastic(
+        participles, EIMI_SUBJUNCTIVE)
+    blocks['middle', 'optative', 'perfect'] = periphrastic(participles,
+                                                           EIMI_OPTATIVE)
+    blocks['middle', 'imperative', 'perfect'] = persons(
+        stem, PERFECT_MIDDLE_IMPERATIVE)
+    # λελύσθαι, accented on the penult
+    blocks['middle', 'infinitive', 'perfect'] = make_form(stem, u'σθαι', -2,
+                                                          exact=True)
+    blocks['middle', 'participle', 'perfect'] = participles
+
+
+def future_perfect_system(blocks, perfect, present, future):
+    # The future's stem with the perfect's reduplication: λελύσομαι. Verbs
+    # whose perfect does not start with a reduplicated present have none.
+    stem = perfect[:-3]
+    if not plain(stem).endswith(plain(present)) or len(stem) == len(present):
+        return
+    reduplication = stem[:len(stem) - len(present)]
+    future_system(blocks, reduplication + future, 'passive',
+                  'future perfect')
+
+
+def aorist_passive_system(blocks, aorist):
+    if not plain(aorist).endswith(u'ην'):
+        raise Exception('Not an aorist passive in -ην: ' +
+                        declension.to_text(aorist).encode('utf-8'))
+    stem = aorist[:-2]
+    if plain(stem).endswith(u'θ'):
+        tense, future_tense = '1st aorist', '1st future'
+    else:
+        tense, future_tense = '2nd aorist', 'future'
+    blocks['passive', 'indicative', tense] = persons(augment(stem),
+                                                     AORIST_PASSIVE)
+    blocks['passive', 'subjunctive', tense] = persons(
+        stem, AORIST_PASSIVE_SUBJUNCTIVE)
+    blocks['passive', 'optative', tense] = persons(stem,
+                                                   AORIST_PASSIVE_OPTATIVE)
+    blocks['passive', 'imperative', tense] = persons(
+        stem, AORIST_PASSIVE_IMPERATIVE)
+    blocks['passive', 'infinitive', tense] = make_form(stem, u'ῆναι', 0)
+    blocks['passive', 'participle', tense] = participle(
+        stem, AORIST_PASSIVE_PARTICIPLE)
+    future_system(blocks, stem + letters(u'ήσομαι'), 'passive',
+                  future_tense)
+
+
+def read_principal_parts(filename):
+    # Lines like 'λύ̄ω, λύ̄σω, ἔλῡσα, λέλυκα, λέλυμαι, ἐλύθην' with - for a
+    # missing part. The verb is known by its present without length marks.
+    # Blank lines and ones starting with # are skipped.
+    with open(filename) as ff:
+        for line in ff:
+            line = line.decode('utf-8').strip()
+            if not line or line.startswith(u'#'):
+                continue
+            parts = [part.strip() for part in line.split(u',')]
+            yield lemma(parts[0]), parts
+
+
+def lemma(present):
+    word = unicodedata.normalize('NFD', present)
+    for mark in LENGTHS:
+        word = word.replace(mark, u'')
+    return unicodedata.normalize('NFC', word).encode('utf-8')
+
+
+def check():
+    # Prints the forms of λύω in prepare_shelf that conjugate does not
+    # give and returns how many there were
+    import verbs
+    saved = getattr(verbs, 'SHELF', None)
+    verbs.SHELF = {}
+    try:
+        verbs.prepare_shelf()
+        reference = verbs.SHELF['λύω']
+    finally:
+        verbs.SHELF = saved
+    made = verbs.conjugate(LUO_PARTS)
+    bad = 0
+    for vv in reference:
+        for mm in reference[vv]:
+            for tt in reference[vv][mm]:
+                want = flatten(reference[vv][mm][tt])
+                got = flatten(made.get(vv, {}).get(mm, {}).get(tt, {}))
+                for key in sorted(want):
+                    if want[key] != got.get(key):
+                        bad += 1
+                        print '%s %s %s %s: %s != %s' % (
+                            vv, mm, tt, key, want[key], got.get(key))
+    # A deponent's paradigm must make cards as well
+    deponent = verbs.conjugate(DEPONENT_PARTS)
+    if 'active' in deponent or not verbs.subset_cards(deponent, [None])[0]:
+        bad += 1
+        print 'deponent %s: no cards' % DEPONENT_PARTS[0]
+    print '%d forms differ' % bad
+    return bad
+
+
+def flatten(node, path=''):
+    if not isinstance(node, dict):
+        return {path: node}
+    output = {}
+    for key, value in node.items():
+        output.update(flatten(value, (path + ' ' + key).strip()))
+    return output
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,690 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import sys
+import unicodedata
+
+import ankigreekutil as anki
+
+ACUTE = u'\u0301'
+GRAVE = u'\u0300'
+CIRCUMFLEX = u'\u0342'
+DIAERESIS = u'\u0308'
+SUBSCRIPT = u'\u0345'
+MACRON = u'\u0304'
+BREVE = u'\u0306'
+ACCENTS = ACUTE + GRAVE + CIRCUMFLEX
+VOWELS = u'αεηιουω'
+DIPHTHONGS = [u'αι', u'ει', u'οι', u'υι', u'αυ', u'ευ', u'ηυ', u'ου']
+NUMBERS = ['Singular', 'Dual', 'Plural']
+CASES = ['Nominative', 'Genitive', 'Dative', 'Accusative', 'Vocative']
+OBLIQUE = ['Genitive', 'Dative']
+GENDERS = {u'ὁ': 'm', u'ἡ': 'f', u'τὸ': 'n', u'ὁ/ἡ': 'm/f'}
+GENDER_NAMES = {'m': 'masculine', 'f': 'feminine', 'n': 'neuter'}
+DECLENSIONS = {1: anki.FIRST_DECL, 2: anki.SECOND_DECL, 3: anki.THIRD_DECL}
+# Stem finals of the third declension, for the dative plural and vocative
+LABIALS_VELARS = u'πβφκγχ'
+DENTALS = u'τδθ'
+# Vowel a stem lengthens into when ντ drops before σι: γέροντ- γέρουσι
+LENGTHENED = {u'ο': u'ου', u'ε': u'ει', u'α': u'ᾱ', u'ι': u'ῑ', u'υ': u'ῡ'}
+# Forms the curated nouns do not show, for check() to compare as they are
+# written: (article and nominative, genitive, number, case, form)
+KNOWN_FORMS = [('ὁ νεανίας', 'νεανίου', 'Singular', 'Dative', 'νεανίᾳ'),
+               ('ὁ πολίτης', 'πολίτου', 'Singular', 'Dative', 'πολίτῃ'),
+               ('ἡ χώρα', 'χώρας', 'Singular', 'Dative', 'χώρᾳ')]
+
+
+def main():
+    args = parse_args()
+    if args.check:
+        sys.exit(1 if check() else 0)
+    if args.lexicon:
+        for word, paradigm in read_lexicon(args.lexicon):
+            print word
+            anki.show_forms(word, {word: paradigm})
+    if args.nominative:
+        article, nominative = args.nominative.decode('utf-8').split(' ', 1)
+        paradigm = decline(nominative, args.genitive.decode('utf-8'),
+                           GENDERS[article], args.declension or
+                           declension_of(args.nominative, nominative,
+                                         args.genitive.decode('utf-8')))
+        anki.show_forms(args.nominative, {args.nominative: paradigm})
+
+
+def parse_args():
+    parser = argparse.ArgumentParser('Declension')
+    parser.add_argument('nominative', nargs='?',
+                        help="article and nominative, as in 'ἡ χώρα'")
+    parser.add_argument('genitive', nargs='?')
+    parser.add_argument('--declension', type=int, choices=[1, 2, 3],
+                        help="otherwise taken from the noun lists or "
+                        "guessed from the endings")
+    parser.add_argument('--lexicon', metavar='FILE',
+                        help="decline every noun in FILE")
+    parser.add_argument('--check', action='store_true',
+                        help="compare the curated nouns' forms with the "
+                        "ones decline gives")
+    return parser.parse_args()
+
+
+def letters(word):
+    # A word as [letter, combining marks] pairs, in NFD
+    output = []
+    for char in unicodedata.normalize('NFD', word):
+        if unicodedata.combining(char) and output:
+            output[-1][1] += char
+        else:
+            output.append([char, u''])
+    return output
+
+
+def plain(lets):
+    return u''.join(base.lower() for base, marks in lets)
+
+
+def to_text(lets):
+    return unicodedata.normalize('NFC', u''.join(base + marks
+                                                 for base, marks in lets))
+
+
+def unaccented(lets):
+    # Drops the accents, keeping a circumflex's α, ι or υ marked long
+    output = []
+    for base, marks in lets:
+        if CIRCUMFLEX in marks and base.lower() in u'αιυ':
+            marks += MACRON
+        for accent in ACCENTS:
+            marks = marks.replace(accent, u'')
+        output.append([base, marks])
+    return output
+
+
+def nuclei(lets):
+    # (index of the letter an accent goes on, long, diphthong) for each
+    # syllable. α, ι and υ count as short unless marked long, and a vowel
+    # marked long stays apart from the next, as in γρᾱῑ́.
+    output = []
+    ii = 0
+    while ii < len(lets):
+        base = lets[ii][0].lower()
+        if base not in VOWELS:
+            ii += 1
+            continue
+        if (ii + 1 < len(lets) and
+                base + lets[ii + 1][0].lower() in DIPHTHONGS and
+                DIAERESIS not in lets[ii + 1][1] and
+                MACRON not in lets[ii][1]):
+            output.append((ii + 1, True, True))
+            ii += 2
+            continue
+        marks = lets[ii][1]
+        output.append((ii, base in u'ηω' or SUBSCRIPT in marks or
+                       MACRON in marks, False))
+        ii += 1
+    return output
+
+
+def accent_of(lets):
+    # The syllable carrying the accent, counted from the start, and the
+    # accent
+    for ii, (carrier, long, diphthong) in enumerate(nuclei(lets)):
+        marks = lets[carrier][1]
+        if diphthong:
+            marks += lets[carrier - 1][1]
+        for accent in ACCENTS:
+            if accent in marks:
+                return ii, accent
+    raise Exception('No accent on ' + to_text(lets).encode('utf-8'))
+
+
+def final_long(lets, nucs, optative=False):
+    # Final -αι and -οι count as short, except in the optative
+    carrier, long, diphthong = nucs[-1]
+    if (not optative and diphthong and carrier == len(lets) - 1 and
+            lets[carrier][0] == u'ι' and
+            lets[carrier - 1][0].lower() in u'αο'):
+        return False
+    return long
+
+
+def place(lets, target, circumflex=False, exact=False, short=False,
+          optative=False):
+    # Puts the accent on syllable target, counted from the start or, when
+    # negative, from the end. Unless exact it moves right as far as the
+    # final syllable allows. circumflex is for a final syllable that takes
+    # one, as in the genitive and dative of oxytones or in contracts.
+    nucs = nuclei(lets)
+    count = len(nucs)
+    long_final = final_long(lets, nucs, optative) and not short
+    if target < 0:
+        target += count
+    if not exact:
+        target = max(target, count - (2 if long_final else 3), 0)
+    target = min(target, count - 1)
+    carrier, long, diphthong = nucs[target]
+    if target == count - 1 and circumflex:
+        lets[carrier][1] += CIRCUMFLEX
+    elif target == count - 2 and long and not long_final:
+        lets[carrier][1] += CIRCUMFLEX
+    else:
+        lets[carrier][1] += ACUTE
+
+
+def make_form(stem, ending, target, circumflex=False, exact=False,
+              short=False, optative=False):
+    # stem with ending, accented on target unless the ending has its own
+    # accent. A list of endings gives alternatives, as the shelf writes
+    # them.
+    if isinstance(ending, list):
+        return u' / '.join(make_form(stem, ee, target, circumflex, exact,
+                                     short, optative) for ee in ending)
+    lets = [list(letter) for letter in stem]
+    tail = letters(ending)
+    if (lets and tail and tail[0][0] == u'ι' and
+            lets[-1][0].lower() + u'ι' in DIPHTHONGS and
+            MACRON not in lets[-1][1]):
+        tail[0][1] = DIAERESIS + tail[0][1]
+    lets.extend(tail)
+    if not any(accent in marks for base, marks in tail
+               for accent in ACCENTS):
+        place(lets, target, circumflex, exact, short, optative)
+    return to_text(lets)
+
+
+def with_ending(lets, old, new):
+    # The word in lets, keeping its accent, with its last old letters
+    # replaced by new
+    return to_text(lets[:len(lets) - old] + letters(new))
+
+
+def table(singular, dual, plural):
+    return {'Singular': dict(zip(CASES, singular)),
+            'Dual': dict(zip(CASES, dual)),
+            'Plural': dict(zip(CASES, plural))}
+
+
+def declension_of(word, nominative, genitive):
+    for declension, words in DECLENSIONS.iteritems():
+        if word in words:
+            return declension
+    return guess_declension(nominative, genitive)
+
+
+def guess_declension(nominative, genitive):
+    nom = plain(letters(nominative))
+    gen = plain(letters(genitive))
+    if gen.endswith(u'ου') and nom.endswith((u'ος', u'ον', u'ους', u'ουν')):
+        return 2
+    if gen.endswith(u'ω') and nom.endswith((u'ως', u'ων')):
+        return 2
+    if (nom.endswith((u'α', u'η', u'ας', u'ης')) and
+            gen.endswith((u'ας', u'ης', u'ου', u'α'))):
+        return 1
+    return 3
+
+
+def decline(nominative, genitive, gender, declension):
+    # A noun's paradigm in the shelf's layout, from its nominative and
+    # genitive singular, its gender ('m', 'f', 'n' or 'm/f') and which of
+    # the three declensions it follows. Mark long α, ι and υ with a macron
+    # where the accent depends on them: νῑ́κη gives νῖκαι.
+    if isinstance(nominative, str):
+        nominative = nominative.decode('utf-8')
+    if isinstance(genitive, str):
+        genitive = genitive.decode('utf-8')
+    nom = letters(nominative)
+    gen = letters(genitive)
+    if declension == 1:
+        forms = first_declension(nom, gen)
+    elif declension == 2:
+        forms = second_declension(nom, gen)
+    elif declension == 3:
+        forms = third_declension(nom, gen, gender == 'n')
+    else:
+        raise Exception('Bad declension: ' + str(declension))
+    forms['Singular']['Nominative'] = to_text(nom)
+    forms['Singular']['Genitive'] = to_text(gen)
+    if gender in GENDER_NAMES:
+        forms['gender'] = GENDER_NAMES[gender]
+    return forms
+
+
+def first_declension(nom, gen):
+    word = plain(nom)
+    idx, accent = accent_of(nom)
+    count = len(nuclei(nom))
+    if word[-2:] in [u'ας', u'ης']:
+        stem = unaccented(nom[:-2])
+        vowel = u'ᾱ' if word.endswith(u'ας') else u'η'
+        if word.endswith(u'ας'):
+            vocative = u'ᾱ'
+        elif word.endswith(u'της'):
+            vocative = u'ᾰ'
+        else:
+            vocative = u'η'
+        # The subscript goes on α without its macron, as in ᾳ
+        singular = [vowel + u'ς', u'ου', u'ᾳ' if vowel == u'ᾱ' else u'ῃ',
+                    vowel + u'ν', vocative]
+    elif word.endswith(u'η'):
+        stem = unaccented(nom[:-1])
+        singular = [u'η', u'ης', u'ῃ', u'ην', u'η']
+    elif word.endswith(u'α'):
+        stem = unaccented(nom[:-1])
+        # α is short after anything but ε, ι or ρ, which the genitive in
+        # -ης shows, and wherever the accent could not stand on a long one
+        eta = plain(gen).endswith(u'ης')
+        if (eta or idx == count - 3 or
+                idx == count - 2 and accent == CIRCUMFLEX):
+            vowel = u'ᾰ'
+        else:
+            vowel = u'ᾱ'
+        singular = [vowel, u'ης' if eta else u'ᾱς', u'ῃ' if eta else u'ᾳ',
+                    vowel + u'ν', vowel]
+    else:
+        raise Exception('Not a first declension noun: ' +
+                        to_text(nom).encode('utf-8'))
+    endings = table(singular, [u'ᾱ', u'αιν', u'αιν', u'ᾱ', u'ᾱ'],
+                    [u'αι', u'ῶν', u'αις', u'ᾱς', u'αι'])
+
+    forms = {}
+    for number in NUMBERS:
+        forms[number] = {}
+        for case in CASES:
+            ending = endings[number][case]
+            if idx < count - 1:
+                form = make_form(stem, ending, idx)
+            else:
+                # Contracts have a circumflex on every ending, oxytones on
+                # those of the genitive and dative
+                form = make_form(stem, ending, -1, accent == CIRCUMFLEX or
+                                 case in OBLIQUE)
+            forms[number][case] = form
+    return forms
+
+
+def second_declension(nom, gen):
+    word = plain(nom)
+    idx, accent = accent_of(nom)
+    count = len(nuclei(nom))
+    contract = attic = False
+    if word.endswith(u'ους'):
+        contract = True
+        endings = table([u'ους', u'ου', u'ῳ', u'ουν', u'ου'],
+                        [u'ω', u'οιν', u'οιν', u'ω', u'ω'],
+                        [u'οι', u'ων', u'οις', u'ους', u'οι'])
+    elif word.endswith(u'ουν'):
+        contract = True
+        endings = table([u'ουν', u'ου', u'ῳ', u'ουν', u'ουν'],
+                        [u'ω', u'οιν', u'οιν', u'ω', u'ω'],
+                        [u'ᾱ', u'ων', u'οις', u'ᾱ', u'ᾱ'])
+    elif word.endswith(u'ως') and plain(gen).endswith(u'ω'):
+        attic = True
+        endings = table([u'ως', u'ω', u'ῳ', u'ων', u'ως'],
+                        [u'ω', u'ῳν', u'ῳν', u'ω', u'ω'],
+                        [u'ῳ', u'ων', u'ῳς', u'ως', u'ῳ'])
+    elif word.endswith(u'ων') and plain(gen).endswith(u'ω'):
+        attic = True
+        endings = table([u'ων', u'ω', u'ῳ', u'ων', u'ων'],
+                        [u'ω', u'ῳν', u'ῳν', u'ω', u'ω'],
+                        [u'ω', u'ων', u'ῳς', u'ω', u'ω'])
+    elif word.endswith(u'ος'):
+        endings = table([u'ος', u'ου', u'ῳ', u'ον', u'ε'],
+                        [u'ω', u'οιν', u'οιν', u'ω', u'ω'],
+                        [u'οι', u'ων', u'οις', u'ους', u'οι'])
+    elif word.endswith(u'ον'):
+        endings = table([u'ον', u'ου', u'ῳ', u'ον', u'ον'],
+                        [u'ω', u'οιν', u'οιν', u'ω', u'ω'],
+                        [u'ᾰ', u'ων', u'οις', u'ᾰ', u'ᾰ'])
+    else:
+        raise Exception('Not a second declension noun: ' +
+                        to_text(nom).encode('utf-8'))
+    stem = unaccented(nom[:-3] if contract else nom[:-2])
+
+    forms = {}
+    for number in NUMBERS:
+        forms[number] = {}
+        for case in CASES:
+            ending = endings[number][case]
+            if attic:
+                # The Attic declension keeps an acute where it stands
+                form = make_form(stem, ending, idx, exact=True)
+            elif contract and idx < count - 1:
+                # Compounds keep the accent of the uncontracted nominative
+                form = make_form(stem, ending, idx, exact=True)
+            elif contract:
+                # Except in the dual, -όω to -ώ
+                form = make_form(stem, ending, -1, number != 'Dual' or
+                                 case in OBLIQUE)
+            elif idx == count - 1:
+                form = make_form(stem, ending, -1, case in OBLIQUE)
+            else:
+                form = make_form(stem, ending, idx)
+            forms[number][case] = form
+    return forms
+
+
+def inflect(stem, endings, target):
+    forms = {}
+    for number in NUMBERS:
+        forms[number] = {}
+        for case in CASES:
+            forms[number][case] = make_form(stem, endings[number][case],
+                                            target)
+    return forms
+
+
+def third_declension(nom, gen, neuter):
+    word = plain(nom)
+    genitive = plain(gen)
+    if word.endswith(u'κλης') and genitive.endswith(u'κλεους'):
+        return kles_stem(nom)
+    if genitive.endswith(u'ους') and word.endswith((u'ης', u'ος')):
+        return s_stem(nom, neuter)
+    if genitive.endswith(u'ους') and word.endswith((u'ως', u'ω')):
+        return oi_stem(nom)
+    if genitive.endswith(u'ως') and word.endswith(u'ας') and neuter:
+        return as_stem(nom)
+    if genitive.endswith(u'εως') and word.endswith(u'ευς'):
+        return eu_stem(nom)
+    if (genitive.endswith(u'εως') and word.endswith((u'ις', u'υς', u'υ')) and
+            word.rstrip(u'ς')[:-1] == genitive[:-3]):
+        return i_stem(nom, gen, neuter)
+    if (word.endswith(u'ηρ') and genitive.endswith((u'τρος', u'δρος'))):
+        return syncopated_stem(nom, gen)
+    if genitive.endswith(u'ος'):
+        return consonant_stem(nom, gen, neuter)
+    raise Exception('No third declension pattern for ' +
+                    to_text(nom).encode('utf-8') + ', ' +
+                    to_text(gen).encode('utf-8'))
+
+
+def kles_stem(nom):
+    # Περικλῆς, contracted from -κλέης, only in the singular
+    stem = unaccented(nom[:-2])
+    return {'Singular': {'Dative': make_form(stem, u'εῖ', 0),
+                         'Accusative': make_form(stem, u'έᾱ', 0),
+                         'Vocative': make_form(stem, u'εις', 0)}}
+
+
+def s_stem(nom, neuter):
+    # τριήρης, γένος: stems in -εσ- that contract once the σ is lost
+    idx, accent = accent_of(nom)
+    stem = unaccented(nom[:-2])
+    if neuter:
+        endings = table([u'ος', u'ους', u'ει', u'ος', u'ος'],
+                        [u'ει', u'οῖν', u'οῖν', u'ει', u'ει'],
+                        [u'η', u'ῶν', u'εσι(ν)', u'η', u'η'])
+    else:
+        endings = table([u'ης', u'ους', u'ει', u'η', u'ες'],
+                        [u'ει', u'οιν', u'οιν', u'ει', u'ει'],
+                        [u'εις', u'ων', u'εσι(ν)', u'εις', u'εις'])
+    forms = inflect(stem, endings, idx)
+    if nom[0][0].isupper():
+        # Names have a recessive vocative, Σώκρατες, and no plural
+        forms['Singular']['Vocative'] = make_form(stem, u'ες', 0)
+        return {'Singular': forms['Singular']}
+    return forms
+
+
+def oi_stem(nom):
+    # αἰδώς, πειθώ, only in the singular
+    if plain(nom).endswith(u'ς'):
+        stem = unaccented(nom[:-2])
+        accusative = make_form(stem, u'ῶ', 0)
+        vocative = to_text(nom)
+    else:
+        stem = unaccented(nom[:-1])
+        accusative = to_text(nom)
+        vocative = make_form(stem, u'οῖ', 0)
+    return {'Singular': {'Dative': make_form(stem, u'οῖ', 0),
+                         'Accusative': accusative, 'Vocative': vocative}}
+
+
+def as_stem(nom):
+    # γέρας, γέρως: neuters whose -ασ- stem contracts
+    idx, accent = accent_of(nom)
+    stem = unaccented(nom[:-2])
+    endings = table([u'ας', u'ως', u'αι', u'ας', u'ας'],
+                    [u'ᾱ', u'ῷν', u'ῷν', u'ᾱ', u'ᾱ'],
+                    [u'ᾱ', u'ῶν', u'ασι(ν)', u'ᾱ', u'ᾱ'])
+    return inflect(stem, endings, idx)
+
+
+def eu_stem(nom):
+    # βασιλεύς, the accent staying on the syllable of -ευ-
+    stem = unaccented(nom[:-3])
+    endings = table([u'εύς', u'έως', u'εῖ', u'έᾱ', u'εῦ'],
+                    [u'ῆ', u'έοιν', u'έοιν', u'ῆ', u'ῆ'],
+                    [[u'ῆς', u'εῖς'], u'έων', u'εῦσι(ν)', u'έᾱς',
+                     [u'ῆς', u'εῖς']])
+    return inflect(stem, endings, 0)
+
+
+def i_stem(nom, gen, neuter):
+    # πόλις, πῆχυς, ἄστυ with the genitive in -εως. The ω of -εως and
+    # -εων lets the accent stay on the antepenult.
+    idx, accent = accent_of(nom)
+    stem = unaccented(gen[:-3])
+    if neuter:
+        plural = [u'η', u'εων', u'εσι(ν)', u'η', u'η']
+    else:
+        plural = [u'εις', u'εων', u'εσι(ν)', u'εις', u'εις']
+    endings = table([u'', u'εως', u'ει', u'', u''],
+                    [u'ει', u'εοιν', u'εοιν', u'ει', u'ει'], plural)
+    forms = inflect(stem, endings, idx)
+    forms['Plural']['Genitive'] = make_form(stem, u'εων', idx, short=True)
+    if neuter:
+        forms['Singular']['Accusative'] = to_text(nom)
+        forms['Singular']['Vocative'] = to_text(nom)
+    else:
+        forms['Singular']['Accusative'] = with_ending(nom, 1, u'ν')
+        forms['Singular']['Vocative'] = with_ending(nom, 1, u'')
+    return forms
+
+
+def syncopated_stem(nom, gen):
+    # πατήρ, μήτηρ, θυγάτηρ and ἀνήρ: the stem in -ερ- loses its ε before
+    # some endings, which are then accented
+    weak = unaccented(gen[:-2])
+    strong = unaccented(nom)
+    strong[-2][0] = u'ε'
+    if plain(weak).endswith(u'δρ'):
+        # ἀνήρ keeps the weak stem, ἀνδρ-, with a recessive accent
+        strong_stem = weak
+        idx = 0
+    else:
+        strong_stem = strong
+        idx = len(nuclei(strong)) - 1
+    endings = table([u'', u'ός', u'ί', u'ᾰ', u''],
+                    [u'ε', u'οιν', u'οιν', u'ε', u'ε'],
+                    [u'ες', u'ων', u'', u'ᾰς', u'ες'])
+    forms = inflect(strong_stem, endings, idx)
+    forms['Singular']['Dative'] = make_form(weak, u'ί', idx)
+    forms['Singular']['Vocative'] = make_form(strong, u'', 0)
+    forms['Plural']['Dative'] = make_form(weak, u'άσι(ν)', 0)
+    if strong_stem is weak:
+        for case in OBLIQUE:
+            forms['Dual'][case] = make_form(weak, u'οῖν', 0)
+        forms['Plural']['Genitive'] = make_form(weak, u'ῶν', 0)
+    return forms
+
+
+def consonant_stem(nom, gen, neuter):
+    # Stems found by taking -ος off the genitive. When the genitive is
+    # accented on its ending, as with most one syllable stems, so are the
+    # genitive and dative of every number.
+    word = plain(nom)
+    stem = unaccented(gen[:-2])
+    final = plain(stem)[-1:]
+    idx, accent = accent_of(nom)
+    oxytone = idx == len(nuclei(nom)) - 1
+    gen_idx, gen_accent = accent_of(gen)
+    on_ending = gen_idx == len(nuclei(gen)) - 1
+    target = len(nuclei(stem)) - 1 if on_ending else gen_idx
+    oblique = -1 if on_ending else target
+    vowel = final in VOWELS and final != u'ω'
+    dental = final in DENTALS
+
+    forms = {'Singular': {}, 'Dual': {}, 'Plural': {}}
+    singular = forms['Singular']
+    singular['Dative'] = make_form(stem, u'ι', oblique)
+    if neuter:
+        singular['Accusative'] = to_text(nom)
+        singular['Vocative'] = to_text(nom)
+    elif vowel:
+        # ἰχθύς, σῦς, βοῦς: ἰχθύν, ἰχθύ
+        singular['Accusative'] = with_ending(nom, 1, u'ν')
+        singular['Vocative'] = with_ending(nom, 1, u'')
+    elif dental and word.endswith((u'ις', u'υς')):
+        # χάρις, χάριν, χάρι but ἐλπίς, ἐλπίδα, ἐλπί
+        if oxytone:
+            singular['Accusative'] = make_form(stem, u'ᾰ', target)
+        else:
+            singular['Accusative'] = with_ending(nom, 1, u'ν')
+        singular['Vocative'] = with_ending(nom, 1, u'')
+    else:
+        singular['Accusative'] = make_form(stem, u'ᾰ', target)
+        if plain(stem).endswith(u'ντ') and not oxytone:
+            # γέρων, γίγας: γέρον, γίγαν
+            singular['Vocative'] = make_form(stem[:-1], u'', 0)
+        elif final in u'νρ' and not oxytone:
+            # δαίμων, ῥήτωρ: δαῖμον, ῥῆτορ
+            singular['Vocative'] = make_form(stem, u'', 0)
+        else:
+            singular['Vocative'] = to_text(nom)
+
+    dual = make_form(stem, u'ε', target)
+    forms['Dual'] = {'Nominative': dual, 'Accusative': dual,
+                     'Vocative': dual}
+    for case in OBLIQUE:
+        forms['Dual'][case] = make_form(stem, u'οιν', oblique, on_ending)
+
+    plural = forms['Plural']
+    plural['Nominative'] = make_form(stem, u'ᾰ' if neuter else u'ες', target)
+    plural['Vocative'] = plural['Nominative']
+    plural['Genitive'] = make_form(stem, u'ων', oblique, on_ending)
+    plural['Dative'] = make_form(dative_plural_stem(nom, stem, vowel),
+                                 u'ι(ν)', oblique)
+    if neuter:
+        plural['Accusative'] = plural['Nominative']
+    elif vowel:
+        # ἰχθῦς, βοῦς: the nominative singular, a final accent circumflex
+        lets = unaccented(nom)
+        place(lets, idx, True, exact=True)
+        plural['Accusative'] = to_text(lets)
+    else:
+        plural['Accusative'] = make_form(stem, u'ᾰς', target)
+    return forms
+
+
+def dative_plural_stem(nom, stem, vowel):
+    # What -ι is added to: the stem and the σ of -σι, with the stem's final
+    # consonant merged into the σ or dropped
+    final = plain(stem)[-1:]
+    sigma = [[u'σ', u'']]
+    if vowel or final == u'ω':
+        # γραῦς, βοῦς, ἥρως: the stem as the nominative has it
+        return unaccented(nom[:-1]) + sigma
+    if final in LABIALS_VELARS:
+        # φύλαξ, φλέψ, θρίξ: ξ or ψ, as in the nominative
+        return unaccented(nom)
+    if plain(stem).endswith(u'ντ'):
+        # ντ drops and the vowel before it lengthens: γέρουσι, Γίγᾱσι
+        lets = stem[:-2]
+        return lets[:-1] + letters(LENGTHENED[lets[-1][0]]) + sigma
+    if final in DENTALS or final == u'ν':
+        return stem[:-1] + sigma
+    return stem + sigma
+
+
+def curated_lexicon():
+    # (word, nominative, genitive, gender, declension, paradigm) for each
+    # curated noun, the paradigms known to be right
+    import nouns
+    saved = getattr(nouns, 'SHELF', None)
+    nouns.SHELF = {}
+    try:
+        nouns.prepare_shelf()
+        shelf = nouns.SHELF
+    finally:
+        nouns.SHELF = saved
+    lexicon = []
+    for word in sorted(shelf):
+        article, nominative = word.decode('utf-8').split(u' ', 1)
+        # Without the uncontracted form some curated contracts give first
+        genitive = uncontracted(shelf[word]['Singular']['Genitive'])
+        lexicon.append((word, nominative, genitive, GENDERS[article],
+                        declension_of(word, nominative, genitive),
+                        shelf[word]))
+    return lexicon
+
+
+def uncontracted(form):
+    return form.split(u') ')[-1]
+
+
+def without_lengths(form):
+    form = unicodedata.normalize('NFD', form)
+    for mark in MACRON + BREVE:
+        form = form.replace(mark, u'')
+    return unicodedata.normalize('NFC', form)
+
+
+def check():
+    # Prints the forms of the curated nouns that decline does not give,
+    # length marks aside, and those of KNOWN_FORMS, and returns how many
+    # there were. A curated contract is compared without its
+    # uncontracted form, which decline does not give.
+    bad = 0
+    cases = []
+    for word, nominative, genitive, gender, number, paradigm in \
+            curated_lexicon():
+        cases.append((word, decline(nominative, genitive, gender, number),
+                      paradigm, without_lengths))
+    for word, genitive, number, case, form in KNOWN_FORMS:
+        article, nominative = word.decode('utf-8').split(u' ', 1)
+        made = decline(nominative, genitive, GENDERS[article],
+                       declension_of(word, nominative,
+                                     genitive.decode('utf-8')))
+        cases.append((word, made, {number: {case: form.decode('utf-8')}},
+                      lambda form: unicodedata.normalize('NFC', form)))
+    for word, made, paradigm, compared in cases:
+        for number in NUMBERS:
+            for case in CASES:
+                want = paradigm.get(number, {}).get(case)
+                got = made.get(number, {}).get(case)
+                if want is None:
+                    continue
+                if (got is None or
+                        compared(uncontracted(want)) != compared(got)):
+                    bad += 1
+                    print (u'%s %s %s: %s != %s' % (
+                        unicode(word, 'utf-8'), number, case, want,
+                        got)).encode('utf-8')
+    print '%d forms differ' % bad
+    return bad
+
+
+def read_lexicon(filename):
+    # Lines like 'ὁ φύλαξ, φύλακος' give the article and nominative, then
+    # the genitive and, where the endings would mislead, the declension.
+    # Blank lines and ones starting with # are skipped.
+    with open(filename) as ff:
+        for line in ff:
+            line = line.decode('utf-8').strip()
+            if not line or line.startswith(u'#'):
+                continue
+            parts = [part.strip() for part in line.split(u',')]
+            article, nominative = parts[0].split(u' ', 1)
+            word = parts[0].encode('utf-8')
+            if len(parts) > 2:
+                declension = int(parts[2])
+            else:
+                declension = declension_of(word, nominative, parts[1])
+            yield word, decline(nominative, parts[1], GENDERS[article],
+                                declension)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import bisect
+import marshal
+import mmap
+import os
+import struct
+
+import ankigreekutil as anki
+import paradigmdata
+import profiling
+from paradigmstore import ParadigmStore, surface_forms_of, to_text
+
+MAGIC = 'GRKINDEX'
+INDEX_VERSION = 1
+# Record tables, each sorted by key: paradigms by word, analyses by the
+# NFC key and by the folded key of each surface form
+TABLES = ['words', 'surface', 'folded']
+# Magic, version, then the offset and record count of each table
+HEADER = struct.Struct('<8sI' + 'QI' * len(TABLES))
+# Offset and length of the key, then of the value, in the blob area
+RECORD = struct.Struct('<QIQI')
+
+
+def main():
+    args = parse_args()
+    if args.export:
+        export(args.export[0], args.export[1], args.kind)
+    if args.show:
+        index = FormIndex(args.index)
+        anki.show_forms(args.show, index)
+        index.close()
+    if args.parse:
+        index = FormIndex(args.index)
+        anki.show_analyses(args.parse, index)
+        index.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser('Form index')
+    parser.add_argument('--export', nargs=2, metavar=('DB', 'INDEX'),
+                        help="write every paradigm and analysis in a store "
+                        "to a read-only index")
+    parser.add_argument('--kind', choices=['noun', 'verb'], default='noun')
+    parser.add_argument('--index', default='nouns.idx',
+                        help="index for --show and --parse")
+    parser.add_argument('--show', metavar='WORD')
+    parser.add_argument('--parse', metavar='FORM',
+                        help="show every analysis of an inflected form")
+    return parser.parse_args()
+
+
+@profiling.stage('export')
+def export(db_file, filename, kind):
+    # Blobs go first, after room for the header, then the record tables and
+    # finally the header. The file is renamed into place when complete, so
+    # readers still mapping an older index keep theirs.
+    store = ParadigmStore(db_file, kind, surface_forms_of(kind))
+    tables = dict((table, []) for table in TABLES)
+    tmpname = filename + '.tmp'
+    with open(tmpname, 'wb') as ff:
+        ff.write('\0' * HEADER.size)
+        writer = BlobWriter(ff)
+        for word in store.keys():
+            blob = marshal.dumps(paradigmdata.to_items(store[word]))
+            tables['words'].append((writer.key(word), writer.write(blob)))
+        analyses = {}
+        for surface, folded, form_id, analysis in store.surface_analyses():
+            if form_id not in analyses:
+                analyses[form_id] = writer.write(marshal.dumps(analysis))
+            for table, key in [('surface', surface), ('folded', folded)]:
+                tables[table].append((writer.key(key.encode('utf-8')),
+                                      analyses[form_id]))
+        header = [MAGIC, INDEX_VERSION]
+        for table in TABLES:
+            # Stable, so each key's analyses stay in the order of the store
+            tables[table].sort(key=lambda record: writer.keys[record[0]])
+            header += [ff.tell(), len(tables[table])]
+            for key, value in tables[table]:
+                ff.write(RECORD.pack(*(key + value)))
+        ff.seek(0)
+        ff.write(HEADER.pack(*header))
+    os.rename(tmpname, filename)
+    store.close()
+    print 'Wrote %d paradigms and %d forms from %s to %s' % (
+        len(tables['words']), len(tables['surface']), db_file, filename)
+
+
+class BlobWriter(object):
+    # Appends strings to the blob area and gives back their (offset,
+    # length). Keys are written once however often they come, and kept for
+    # sorting the tables.
+
+    def __init__(self, ff):
+        self.ff = ff
+        self.offsets = {}
+        self.keys = {}
+
+    def write(self, data):
+        where = (self.ff.tell(), len(data))
+        self.ff.write(data)
+        return where
+
+    def key(self, data):
+        if data not in self.offsets:
+            where = self.write(data)
+            self.offsets[data] = where
+            self.keys[where] = data
+        return self.offsets[data]
+
+
+class Keys(object):
+    # The keys of one record table as a sequence, for bisect
+
+    def __init__(self, index, table):
+        self.mm = index.mm
+        self.offset, self.count = index.tables[table]
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, ii):
+        record = RECORD.unpack_from(self.mm, self.offset + ii * RECORD.size)
+        return self.mm[record[0]:record[0] + record[1]]
+
+    def value(self, ii):
+        record = RECORD.unpack_from(self.mm, self.offset + ii * RECORD.size)
+        return self.mm[record[2]:record[2] + record[3]]
+
+
+class FormIndex(object):
+    # Read-only paradigms and analyses in one file written by export(),
+    # answering the lookups ParadigmStore does. The file is mapped rather
+    # than read, so processes on one machine share its pages through the
+    # OS cache, and opening it costs no more than reading the header.
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.ff = open(filename, 'rb')
+        self.mm = mmap.mmap(self.ff.fileno(), 0, access=mmap.ACCESS_READ)
+        header = HEADER.unpack_from(self.mm, 0)
+        if header[0] != MAGIC or header[1] != INDEX_VERSION:
+            raise Exception('Not a form index: ' + filename)
+        self.tables = dict((table, header[2 + 2 * ii:4 + 2 * ii])
+                           for ii, table in enumerate(TABLES))
+        self.keys_of = dict((table, Keys(self, table)) for table in TABLES)
+
+    def lookup(self, table, key):
+        # The values of every record under key, in table order
+        keys = self.keys_of[table]
+        ii = bisect.bisect_left(keys, key)
+        values = []
+        while ii < len(keys) and keys[ii] == key:
+            values.append(keys.value(ii))
+            ii += 1
+        return values
+
+    def analyze(self, surface):
+        # As ParadigmStore.analyze: exact matches, or else folded ones
+        exact, folded = anki.form_keys(to_text(surface))
+        values = self.lookup('surface', exact.encode('utf-8'))
+        if not values:
+            values = self.lookup('folded', folded.encode('utf-8'))
+        return [marshal.loads(value) for value in values]
+
+    def reopen(self):
+        # The mapping survives a fork, so workers can keep using it
+        return self
+
+    def close(self):
+        self.mm.close()
+        self.ff.close()
+
+    def keys(self):
+        keys = self.keys_of['words']
+        return [keys[ii] for ii in xrange(len(keys))]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __contains__(self, word):
+        return bool(self.lookup('words', word))
+
+    def get(self, word, default=None):
+        try:
+            return self[word]
+        except KeyError:
+            return default
+
+    def __getitem__(self, word):
+        profiling.count('index_reads')
+        values = self.lookup('words', word)
+        if not values:
+            raise KeyError(word)
+        return paradigmdata.from_items(marshal.loads(values[0]))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,25 +1,64 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import shelve
 import argparse
 import re
-import os
+import hashlib
+import json
+from multiprocessing.pool import ThreadPool
 
 import ankigreekutil as anki
+import apkg
+import declension
+import formindex
+import paradigmdata
+import profiling
+import wiktionarydump
+from paradigmstore import ParadigmStore
+
+FETCH_JOBS = 8
+# Bump when the card lines change, so --incremental rebuilds every word
+MANIFEST_VERSION = 2
+# Cases in the order a word's reverse cards are written
+CASES = ['Nominative', 'Genitive', 'Dative', 'Accusative', 'Vocative']
+TABLE_TAGS_RE = re.compile(r'<(/?)(table|tr|th|td)\b[^>]*>')
+GENDER_RE = re.compile(r'<abbr title="([^"]*) gender">.</abbr>')
+STRIP_TAGS_RE = re.compile(r'<.*?>')
 
 
 def main():
     args = parse_args()
+    if args.profile:
+        profiling.enable(args.cprofile)
     if args.get:
         download_and_save(args.get)
+    declined = install_declined(args.decline) if args.decline else []
+    if args.dump:
+        wiktionarydump.ingest(args.dump, SHELF)
+    lookup = formindex.FormIndex(args.index) if args.index else SHELF
     if args.show:
-        anki.show_forms(args.show, SHELF)
+        anki.show_forms(args.show, lookup)
+    if args.reindex:
+        SHELF.reindex()
+    if args.parse:
+        anki.show_analyses(args.parse, lookup)
+    if args.reparse:
+        reparse_archive()
     if args.anki:
-        prepare_shelf()
-        create_noun_files(anki.NOUNS)
-
-
+        paradigmdata.install('noun', SHELF)
+        words = anki.NOUNS + [word for word in declined
+                              if word not in anki.NOUNS]
+        create_noun_files(words, args.jobs, args.flush_size,
+                          args.incremental, args.apkg)
+        if args.diff_against:
+            for filename in [anki.NOUNS_FILE, anki.NOUNS_REVERSE]:
+                anki.write_deck_diff(filename, args.diff_against,
+                                     args.flush_size)
+    if args.profile:
+        profiling.save(args.profile, {'http_cache': anki.CACHE_STATS})
+
+
+@profiling.stage('prepare')
 def prepare_shelf():
     SHELF['ἡ μνᾶ'] = {
         'Singular': {'Nominative': u'μνᾶ',
@@ -248,31 +287,165 @@ def prepare_shelf():
 
 
 def download_and_save(word):
+    save_forms(word, fetch_forms(word))
+
+
+@profiling.stage('prepare')
+def install_declined(filename):
+    # Declines every noun in a lexicon file into the shelf, writing only
+    # the paradigms that changed, and returns their words in file order.
+    # With --anki the curated paradigms are installed afterwards and win.
+    words = []
+    for word, paradigm in declension.read_lexicon(filename):
+        words.append(word)
+        if SHELF.get(word) != paradigm:
+            SHELF[word] = paradigm
+            profiling.count('declined_installed')
+    return words
+
+
+def fetch_forms(word):
     html = anki.get_html_from_wiktionary(word)
-    forms = get_noun_forms(html)
-    save_forms(word, forms)
+    return get_noun_forms(html)
 
 
-def create_noun_files(words):
+def fetch_forms_or_none(word):
     try:
-        os.unlink(anki.NOUNS_FILE)
-    except OSError:
-        pass
+        return word, fetch_forms(word)
+    except Exception:
+        return word, None
+
+
+def prefetch_forms(words, jobs=FETCH_JOBS):
+    # Download and parse every word missing from the shelf on a bounded
+    # thread pool. Results are saved from this thread, in word order, so
+    # the shelf is never touched concurrently.
+    missing = [word for word in words if not SHELF.get(word)]
+    if not missing:
+        return set()
+    pool = ThreadPool(min(jobs, len(missing)))
     try:
-        os.unlink(anki.NOUNS_REVERSE)
-    except OSError:
-        pass
+        for word, forms in pool.imap(fetch_forms_or_none, missing):
+            if forms is not None:
+                save_forms(word, forms)
+    finally:
+        pool.close()
+        pool.join()
+    return set(missing)
+
+
+def reparse_archive():
+    # Rebuild shelf entries from the archived pages, without the network
+    words = anki.archived_words()
     for word in words:
-        output_word_defs(word)
-
-
-def output_word_defs(word):
+        save_forms(word, get_noun_forms(anki.archived_html(word)))
+    print 'Reparsed %d archived pages' % len(words)
+
+
+@profiling.stage('build')
+def create_noun_files(words, jobs=1, flush_size=anki.DECK_FLUSH_SIZE,
+                      incremental=False, package=False):
+    prefetched = set()
+    if jobs > 1:
+        prefetched = prefetch_forms(words, jobs)
+    previous = {}
+    if incremental:
+        previous = previous_word_defs()
+    manifest = []
+    blocks = []
+    with anki.DeckWriter(anki.NOUNS_FILE, flush_size) as deck:
+        with anki.DeckWriter(anki.NOUNS_REVERSE, flush_size) as reverse:
+            for word in words:
+                entry = shelf_entry_hash(word)
+                if entry and entry == previous.get(word, {}).get('entry'):
+                    forward_lines = previous[word]['forward']
+                    reverse_lines = previous[word]['reverse']
+                else:
+                    forward_lines, reverse_lines = word_defs(word, prefetched)
+                    entry = shelf_entry_hash(word)
+                for line in reverse_lines:
+                    reverse.write(line)
+                for line in forward_lines:
+                    deck.write(line)
+                if package:
+                    blocks.append((word, forward_lines, reverse_lines))
+                manifest.append({'word': word,
+                                 'entry': entry,
+                                 'forward': lines_hash(forward_lines),
+                                 'reverse': lines_hash(reverse_lines)})
+    anki.save_json(anki.NOUNS_MANIFEST, {'version': MANIFEST_VERSION,
+                                         'words': manifest})
+    if package:
+        write_packages(blocks, flush_size)
+
+
+def write_packages(blocks, flush_size=apkg.NOTE_FLUSH_SIZE):
+    # An Anki package for each card file, from each word's lines
+    for textfile, side in [(anki.NOUNS_FILE, 1), (anki.NOUNS_REVERSE, 2)]:
+        with apkg.ApkgWriter(*apkg.package_for(textfile),
+                             flush_size=flush_size) as package:
+            for block in blocks:
+                for line in block[side]:
+                    package.write(line, block[0])
+
+
+def shelf_entry_hash(word):
+    forms = SHELF.get(word)
+    if not forms:
+        return None
+    entry = json.dumps([MANIFEST_VERSION, word, forms], sort_keys=True)
+    return hashlib.sha1(entry).hexdigest()
+
+
+def lines_hash(lines):
+    return [len(lines), hashlib.sha1("\n".join(lines)).hexdigest()]
+
+
+def previous_word_defs():
+    # Cut the current card files back into each word's lines, using the
+    # line counts in the manifest, keeping only the blocks whose lines still
+    # match the manifest
+    manifest = anki.load_json(anki.NOUNS_MANIFEST)
+    if not manifest or manifest['version'] != MANIFEST_VERSION:
+        return {}
+    files = {}
+    for kind, filename in [('forward', anki.NOUNS_FILE),
+                           ('reverse', anki.NOUNS_REVERSE)]:
+        try:
+            with open(filename) as ff:
+                files[kind] = ff.read().splitlines()
+        except IOError:
+            return {}
+        if len(files[kind]) != sum(ww[kind][0] for ww in manifest['words']):
+            return {}
+
+    previous = {}
+    start = {'forward': 0, 'reverse': 0}
+    for ww in manifest['words']:
+        defs = {'entry': ww['entry']}
+        for kind in ['forward', 'reverse']:
+            count = ww[kind][0]
+            defs[kind] = files[kind][start[kind]:start[kind] + count]
+            start[kind] += count
+        if (lines_hash(defs['forward']) == ww['forward'] and
+                lines_hash(defs['reverse']) == ww['reverse']):
+            previous[ww['word'].encode('utf-8')] = defs
+    return previous
+
+
+@profiling.stage('cards')
+def word_defs(word, prefetched=()):
+    # Returns the forward and reverse card lines for word
+    # Words in prefetched have already had their one download attempt
     try:
-        if not SHELF.get(word):
+        if not SHELF.get(word) and word not in prefetched:
             download_and_save(word)
+        forms = SHELF[word]
     except:
         print (u"Bad defintion for " + unicode(word, 'utf-8')).encode('utf-8')
-        return
+        return [], []
+    forward_lines = []
+    reverse_lines = []
 
     # article = article_from_gender(SHELF[word]['gender'])
     # nom_sing = SHELF[word]['Singular']['Nominative']
@@ -281,38 +454,54 @@ def output_word_defs(word):
     dict_form = unicode(word, 'utf-8')
 
     cases = ['Singular', 'Plural', 'Dual']
+    # Forms are compared by their NFC keys, and written as first seen
     defs = {}
-    if not SHELF[word].get('Singular'):
+    shown = {}
+    if not forms.get('Singular'):
         print (u"Bad defintion for " + unicode(word, 'utf-8')).encode('utf-8')
     for case in cases:
-        if not SHELF[word].get(case):
+        if not forms.get(case):
             continue
-        for decl, form in SHELF[word][case].iteritems():
+        for decl, form in sorted(forms[case].iteritems(), key=case_order):
             article = article_for_word(word, case, decl)
             for ff in min_form(clean_form(form)):
-                if not defs.get(ff):
-                    defs[ff] = []
-                defs[ff].append([case, decl])
+                key = anki.nfc_key(ff)
+                if not defs.get(key):
+                    defs[key] = []
+                    shown[key] = ff
+                defs[key].append([case, decl])
             ss = dict_form + "<br>" + article + " ________; "
             answers = min_form(clean_form(form))
             answers = map(lambda xx: article + ' ' + xx, answers)
             ss += "<br>".join(answers)
 
             if not ignore_cases(article, case, decl):
-                with open(anki.NOUNS_REVERSE, 'a') as ff:
-                    ff.write(ss.encode('utf-8') + "\n")
-
-    # forward
-    for form in defs.keys():
-        articles = set()
-        for case, decl in defs[form]:
-            articles.add(article_for_word(word, case, decl))
+                reverse_lines.append(ss.encode('utf-8'))
+            elif profiling.ENABLED:
+                profiling.count('cards_ignored')
+
+    # forward, sorted by form and with the articles in case order
+    for key in sorted(defs):
+        articles = []
+        for case, decl in defs[key]:
+            article = article_for_word(word, case, decl)
+            if article not in articles:
+                articles.append(article)
+        form = shown[key]
         ss = form + '; '
         for article in articles:
             ss += article + ' ' + form + '<br>'
         ss += '<br>' + dict_form
-        with open(anki.NOUNS_FILE, 'a') as ff:
-            ff.write(ss.encode('utf-8') + "\n")
+        forward_lines.append(ss.encode('utf-8'))
+
+    return forward_lines, reverse_lines
+
+
+def case_order(item):
+    decl = item[0]
+    if decl in CASES:
+        return CASES.index(decl), decl
+    return len(CASES), decl
 
 
 def ignore_cases(article, case, decl):
@@ -337,6 +526,8 @@ def min_form(form):
     for form in forms:
         output += replace_movable_n(form)
 
+    if profiling.ENABLED:
+        profiling.count('min_form_forms', len(output))
     return output
 
 
@@ -374,6 +565,12 @@ def article_for_word(word, case, decl):
     return anki.ARTICLE_MAP[gender][case][decl]
 
 
+def surface_forms(form):
+    if not form:
+        return []
+    return min_form(clean_form(form))
+
+
 def clean_form(form):
     articles = [u'οἱ', u'τοὺς', u'τοῖς', u'τοῦ', u'τὸν', u'τῷ', u'τοῖν',
                 u'τῶν', u'τὼ', u'ὁ', u'ὁ/ἡ', u'οἱ/αἱ', u'τῷ/τῇ', u'τὸν/τὴν',
@@ -389,10 +586,152 @@ def parse_args():
     parser.add_argument('--get')
     parser.add_argument('--show')
     parser.add_argument('--anki', action='store_true')
+    parser.add_argument('--decline', metavar='LEXICON',
+                        help="generate the paradigms of the nouns in "
+                        "LEXICON instead of fetching them; with --anki they "
+                        "get cards too")
+    parser.add_argument('--dump', metavar='FILE',
+                        help="decline every Ancient Greek noun in a "
+                        "Wiktionary XML dump (.xml or .xml.bz2) that the "
+                        "shelf doesn't have; rerun to resume")
+    parser.add_argument('--parse', metavar='FORM',
+                        help="show every analysis of an inflected form")
+    parser.add_argument('--index', metavar='FILE',
+                        help="answer --show and --parse from an index "
+                        "written by formindex.py --export")
+    parser.add_argument('--reindex', action='store_true',
+                        help="rebuild the inflected form index")
+    parser.add_argument('--reparse', action='store_true',
+                        help="rebuild the shelf from archived pages")
+    parser.add_argument('--incremental', action='store_true',
+                        help="with --anki, only rebuild the cards of words "
+                        "whose shelf entry changed")
+    parser.add_argument('--diff-against', metavar='PREVIOUS',
+                        help="with --anki, also write the cards added, "
+                        "changed and removed since the card files in the "
+                        "PREVIOUS directory, as nouns.added.txt and so on")
+    parser.add_argument('--flush-size', type=int,
+                        default=anki.DECK_FLUSH_SIZE,
+                        help="card lines buffered between writes")
+    parser.add_argument('--jobs', type=int, default=FETCH_JOBS,
+                        help="concurrent downloads for words missing from "
+                        "the shelf (1 downloads serially)")
+    parser.add_argument('--apkg', action='store_true',
+                        help="with --anki, also write the cards as Anki "
+                        "packages")
+    parser.add_argument('--profile', metavar='FILE',
+                        help="write the time spent in each stage and other "
+                        "counts to FILE as JSON")
+    parser.add_argument('--cprofile', action='store_true',
+                        help="with --profile, also list the hottest "
+                        "functions and save cProfile stats to FILE.prof")
     return parser.parse_args()
 
 
+@profiling.stage('parse')
 def get_noun_forms(html):
+    # Jump to the inflection table and the gender with str.find, then read
+    # only the table as a stream of tags. Nothing after the table is read
+    # unless the gender has not been seen yet.
+
+    forms = {}
+
+    table_at = next_tag(html, 'table', 'inflection-table', 0)
+    if table_at < 0:
+        gender = find_gender(html, 0, len(html))
+    else:
+        gender = (find_gender(html, 0, table_at) or
+                  find_gender(html, table_at, len(html)))
+    if gender:
+        forms['gender'] = gender
+
+    if table_at >= 0:
+        read_inflection_table(html, table_at, forms)
+
+    return forms
+
+
+def next_tag(html, tag, marker, pos):
+    # Start of the next <tag ...> whose attributes contain marker
+    while True:
+        found = html.find(marker, pos)
+        if found < 0:
+            return -1
+        start = html.rfind('<', 0, found)
+        if html.startswith('<' + tag, start):
+            return start
+        pos = found + len(marker)
+
+
+def find_gender(html, start, end):
+    pos = start
+    while True:
+        found = html.find(' gender">', pos, end)
+        if found < 0:
+            return None
+        gender_match = GENDER_RE.match(html, html.rfind('<', 0, found))
+        if gender_match:
+            return gender_match.group(1)
+        pos = found + 1
+
+
+def read_inflection_table(html, pos, forms):
+    # Grab the headers for the first tr (Sing, Dual, Plur)
+    # Grab the header of the next tr (Nom, or Gen, etc.)
+    # Grab the td values, setting map['singular']['nominative'] etc.
+
+    headers = []
+
+    first_tr = True
+
+    data_header = None
+    data_group = 0
+
+    pos = html.find('>', pos) + 1
+    while True:
+        match = TABLE_TAGS_RE.search(html, pos)
+        if not match:
+            return
+        pos = match.end()
+        closing, tag = match.groups()
+
+        if closing:
+            if tag == 'table':
+                return
+            if tag == 'tr':
+                first_tr = False
+            continue
+
+        if tag == 'th':
+            header = STRIP_TAGS_RE.sub('', html[pos:html.find('</th>', pos)])
+            if first_tr:
+                headers.append(header)
+            else:
+                data_header = header
+                data_group = 0
+        elif tag == 'td' and not first_tr:
+            word = cell_text(html[pos:html.find('</td>', pos)])
+            if word is not None:
+                data_group += 1
+                header = headers[data_group]
+                if not forms.get(header):
+                    forms[header] = {}
+                forms[header][data_header] = unicode(word, 'utf-8')
+
+
+def cell_text(cell):
+    # The text of the last link in the cell, or of a span closing the cell
+    end = cell.rfind('</a>')
+    if end >= 0 and '<a' in cell[:end]:
+        return cell[cell.rfind('>', 0, end) + 1:end]
+    if cell.endswith('</span>') and '<spa' in cell:
+        end = len(cell) - len('</span>')
+        return cell[cell.rfind('>', 0, end) + 1:end]
+    return None
+
+
+def get_noun_forms_by_line(html):
+    # The original line scanner, kept as the reference for bench.py
     # Go through lines until table.*inflection-table
     # Grab the headers for the first tr (Sing, Dual, Plur)
     # Grab the header of the next tr (Nom, or Gen, etc.)
@@ -476,6 +815,11 @@ def save_forms(noun, forms):
 
 if __name__ == '__main__':
     global SHELF
-    SHELF = shelve.open('nouns.shelf')
+    SHELF = ParadigmStore('nouns.db', 'noun', surface_forms)
+    anki.open_http_cache()
+    anki.open_html_archive()
     main()
+    anki.close_html_archive()
+    anki.close_http_cache()
+    anki.show_cache_stats()
     SHELF.close()
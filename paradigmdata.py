@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import hashlib
+import marshal
+import os
+import struct
+from collections import OrderedDict
+
+import profiling
+
+CURATED_FILE = 'curated.dat'
+CURATED_VERSION = 1
+# The files whose prepare_shelf the artifact is compiled from
+SOURCES = {'noun': 'nouns.py', 'verb': 'verbs.py'}
+HERE = os.path.dirname(os.path.abspath(__file__))
+HEADER = struct.Struct('<I')
+
+
+def main():
+    args = parse_args()
+    if args.compile:
+        compile_curated()
+    if args.list:
+        for kind in sorted(SOURCES):
+            print kind + ': ' + ', '.join(load(kind).keys())
+
+
+def parse_args():
+    parser = argparse.ArgumentParser('Paradigm data')
+    parser.add_argument('--compile', action='store_true',
+                        help="rebuild " + CURATED_FILE + " from the "
+                        "prepare_shelf functions")
+    parser.add_argument('--list', action='store_true',
+                        help="list the lemmas in " + CURATED_FILE)
+    return parser.parse_args()
+
+
+def source_hashes():
+    hashes = {}
+    for kind, source in SOURCES.iteritems():
+        with open(os.path.join(HERE, source)) as ff:
+            hashes[kind] = hashlib.sha1(ff.read()).hexdigest()
+    return hashes
+
+
+def compile_curated(filename=CURATED_FILE):
+    # Runs each prepare_shelf into a dict and writes every paradigm as its
+    # own marshal blob, after a header indexing them by kind and lemma
+    import nouns
+    import verbs
+    paradigms = {}
+    for kind, module in [('noun', nouns), ('verb', verbs)]:
+        saved = getattr(module, 'SHELF', None)
+        module.SHELF = {}
+        try:
+            module.prepare_shelf()
+            paradigms[kind] = module.SHELF
+        finally:
+            module.SHELF = saved
+
+    blobs = []
+    index = {}
+    offset = 0
+    for kind in sorted(paradigms):
+        index[kind] = []
+        for word in sorted(paradigms[kind]):
+            blob = marshal.dumps(to_items(paradigms[kind][word]))
+            index[kind].append((word, offset, len(blob)))
+            blobs.append(blob)
+            offset += len(blob)
+    header = marshal.dumps({'version': CURATED_VERSION,
+                            'sources': source_hashes(),
+                            'index': index})
+    tmpname = filename + '.tmp'
+    with open(tmpname, 'wb') as ff:
+        ff.write(HEADER.pack(len(header)))
+        ff.write(header)
+        for blob in blobs:
+            ff.write(blob)
+    os.rename(tmpname, filename)
+
+
+def to_items(node):
+    # Nested dicts as nested tuples of (key, value) pairs in the order the
+    # dicts give them. Cards come out in that order, and a dict rebuilt by
+    # marshal or pickle can iterate in another.
+    if isinstance(node, dict):
+        return tuple((key, to_items(value)) for key, value in node.iteritems())
+    return node
+
+
+def from_items(node):
+    if isinstance(node, tuple):
+        return OrderedDict((key, from_items(value)) for key, value in node)
+    return node
+
+
+def read_header(filename):
+    # The open artifact, its header and where the paradigms start
+    try:
+        ff = open(filename, 'rb')
+    except IOError:
+        return None, None, None
+    size = HEADER.unpack(ff.read(HEADER.size))[0]
+    header = marshal.loads(ff.read(size))
+    return ff, header, HEADER.size + size
+
+
+def load(kind, filename=CURATED_FILE):
+    # The curated paradigms of one kind, compiling the artifact first if it
+    # is missing or older than the code that makes it
+    ff, header, start = read_header(filename)
+    if (not header or header['version'] != CURATED_VERSION or
+            header['sources'] != source_hashes()):
+        if ff:
+            ff.close()
+        compile_curated(filename)
+        ff, header, start = read_header(filename)
+    return CuratedParadigms(ff, start, header['index'][kind])
+
+
+@profiling.stage('prepare')
+def install(kind, shelf):
+    # Copies the curated paradigms into a shelf, writing only the ones that
+    # are missing or differ from what it already holds
+    curated = load(kind)
+    for word in curated:
+        paradigm = curated[word]
+        if shelf.get(word) != paradigm:
+            shelf[word] = paradigm
+            profiling.count('curated_installed')
+    curated.close()
+
+
+class CuratedParadigms(object):
+    # Read-only view of one kind's paradigms in the artifact. Only the
+    # index is read up front; a paradigm is unmarshalled when asked for.
+
+    def __init__(self, ff, start, index):
+        self.ff = ff
+        self.start = start
+        self.index = dict((word, (offset, size))
+                          for word, offset, size in index)
+        self.words = [word for word, offset, size in index]
+
+    def keys(self):
+        return list(self.words)
+
+    def __iter__(self):
+        return iter(self.words)
+
+    def __contains__(self, word):
+        return word in self.index
+
+    def get(self, word, default=None):
+        if word not in self.index:
+            return default
+        return self[word]
+
+    def __getitem__(self, word):
+        offset, size = self.index[word]
+        self.ff.seek(self.start + offset)
+        return from_items(marshal.loads(self.ff.read(size)))
+
+    def close(self):
+        self.ff.close()
+
+
+if __name__ == '__main__':
+    main()
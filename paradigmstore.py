@@ -0,0 +1,321 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import shelve
+import sqlite3
+
+import ankigreekutil as anki
+import profiling
+
+SCHEMA_VERSION = 3
+# Columns of a form row, in the order they nest in a paradigm dict:
+# nouns are paradigm[number][case], verbs paradigm[voice][mood][tense]
+# followed by [person] or, for participles, [number][case][gender]
+COLUMNS = ['voice', 'mood', 'tense', 'person', 'number', 'gram_case',
+           'gender']
+VERB_PATHS = {3: ['voice', 'mood', 'tense'],
+              4: ['voice', 'mood', 'tense', 'person'],
+              6: ['voice', 'mood', 'tense', 'number', 'gram_case', 'gender']}
+NOUN_PATH = ['number', 'gram_case']
+
+
+def main():
+    args = parse_args()
+    if args.migrate:
+        migrate(args.migrate[0], args.migrate[1], args.kind)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser('Paradigm store')
+    parser.add_argument('--migrate', nargs=2, metavar=('SHELF', 'DB'),
+                        help="copy every paradigm in a shelf into a store")
+    parser.add_argument('--kind', choices=['noun', 'verb'], default='noun')
+    return parser.parse_args()
+
+
+def surface_forms_of(kind):
+    # The form index is written as the paradigms are, so a store needs the
+    # surface forms of the kind it holds
+    if kind == 'noun':
+        import nouns
+        return nouns.surface_forms
+    import verbs
+    return verbs.all_words
+
+
+def migrate(shelf_file, db_file, kind):
+    shelf = shelve.open(shelf_file, 'r')
+    store = ParadigmStore(db_file, kind, surface_forms_of(kind))
+    store.update((word, shelf[word]) for word in shelf.keys())
+    print 'Copied %d paradigms from %s to %s' % (len(store.keys()),
+                                                 shelf_file, db_file)
+    store.close()
+    shelf.close()
+
+
+def to_text(value):
+    if isinstance(value, str):
+        return value.decode('utf-8')
+    return value
+
+
+def analysis_of(row):
+    # A dict of the word, the analysis and the stored form from a row of
+    # lemma, COLUMNS and form
+    analysis = {'lemma': row[0].encode('utf-8'),
+                'form': row[-1].encode('utf-8')}
+    for name, value in zip(COLUMNS, row[1:-1]):
+        if value is not None:
+            analysis[name] = value.encode('utf-8')
+    return analysis
+
+
+class ParadigmStore(object):
+    # Stores noun or verb paradigms one form per row, and reads them back
+    # into the same nested dicts that the shelves held. Looking up a word
+    # only reads that word's rows, and forms can be searched by the index.
+    # Words and dict keys come back as utf-8 str, noun forms as unicode and
+    # verb forms as utf-8 str, just as nouns.py and verbs.py store them.
+    #
+    # surface_forms maps a stored form, such as u'(νόος) νοῦς', to the
+    # forms a reader would meet in a text. Each of those is indexed in the
+    # surface table under its NFC and folded keys, which analyze() looks up.
+
+    def __init__(self, filename, kind, surface_forms=None):
+        self.filename = filename
+        self.kind = kind
+        self.surface_forms = surface_forms
+        self.db = sqlite3.connect(filename)
+        self.create_tables()
+
+    def create_tables(self):
+        version = self.db.execute('PRAGMA user_version').fetchone()[0]
+        if version == SCHEMA_VERSION:
+            return
+        if version > SCHEMA_VERSION:
+            raise Exception('Unknown paradigm store version: %d' % version)
+        if version == 1 and not self.surface_forms:
+            # Its form index can only be built knowing the surface forms
+            raise Exception('Paradigm store %s is version 1: open it from '
+                            'nouns.py or verbs.py to upgrade it' %
+                            self.filename)
+        with self.db:
+            if version < 1:
+                self.db.execute('CREATE TABLE lemmas ('
+                                'id INTEGER PRIMARY KEY, '
+                                'lemma TEXT NOT NULL UNIQUE, '
+                                'gender TEXT)')
+                self.db.execute('CREATE TABLE forms ('
+                                'lemma_id INTEGER NOT NULL REFERENCES lemmas, '
+                                'seq INTEGER NOT NULL, ' +
+                                ''.join(cc + ' TEXT, ' for cc in COLUMNS) +
+                                'form TEXT NOT NULL)')
+                self.db.execute('CREATE INDEX forms_lemma '
+                                'ON forms (lemma_id, seq)')
+                self.db.execute('CREATE INDEX forms_form ON forms (form)')
+            if version < 2:
+                self.db.execute('CREATE TABLE surface ('
+                                'surface TEXT NOT NULL, '
+                                'form_id INTEGER NOT NULL REFERENCES forms)')
+                self.db.execute('CREATE INDEX surface_surface '
+                                'ON surface (surface)')
+                self.db.execute('CREATE INDEX surface_form_id '
+                                'ON surface (form_id)')
+            if version < 3:
+                self.db.execute('ALTER TABLE surface ADD COLUMN folded TEXT')
+                self.db.execute('CREATE INDEX surface_folded '
+                                'ON surface (folded)')
+            if version == 2 and not self.surface_forms:
+                # Keep the index, adding the folded keys it lacks
+                surfaces = self.db.execute('SELECT DISTINCT surface '
+                                           'FROM surface').fetchall()
+                self.db.executemany('UPDATE surface SET folded = ? '
+                                    'WHERE surface = ?',
+                                    [(anki.folded_key(row[0]), row[0])
+                                     for row in surfaces])
+            self.db.execute('PRAGMA user_version = %d' % SCHEMA_VERSION)
+        if version == 1 or (version == 2 and self.surface_forms):
+            self.reindex()
+
+    def reindex(self):
+        # Rebuilds the surface table from every stored form
+        if not self.surface_forms:
+            raise Exception('Cannot reindex without surface forms')
+        with self.db:
+            self.db.execute('DELETE FROM surface')
+            forms = self.db.execute('SELECT rowid, form FROM forms')
+            self.db.executemany('INSERT INTO surface VALUES (?, ?, ?)',
+                                self.surface_rows(forms.fetchall()))
+
+    def surface_rows(self, forms):
+        if not self.surface_forms:
+            return
+        for form_id, form in forms:
+            if self.kind == 'verb':
+                form = form.encode('utf-8')
+            seen = set()
+            for surface in self.surface_forms(form):
+                surface, folded = anki.form_keys(to_text(surface))
+                if surface and surface not in seen:
+                    seen.add(surface)
+                    yield surface, form_id, folded
+
+    def analyze(self, surface):
+        # Every stored form that surface is a reading of, as dicts of the
+        # word, its analysis and the stored form. A surface written without
+        # its accents or length marks matches on the folded key instead.
+        exact, folded = anki.form_keys(to_text(surface))
+        rows = self.surface_matches('surface', exact)
+        if not rows:
+            rows = self.surface_matches('folded', folded)
+        return [analysis_of(row) for row in rows]
+
+    def surface_matches(self, column, key):
+        return self.db.execute('SELECT lemmas.lemma, ' +
+                               ', '.join('forms.' + cc for cc in COLUMNS) +
+                               ', forms.form FROM surface '
+                               'JOIN forms ON forms.rowid = surface.form_id '
+                               'JOIN lemmas ON lemmas.id = forms.lemma_id '
+                               'WHERE surface.' + column + ' = ? '
+                               'ORDER BY lemmas.id, forms.seq',
+                               (key,)).fetchall()
+
+    def surface_analyses(self):
+        # (surface, folded, form id, analysis) for every indexed surface
+        # form, in the order analyze() gives them
+        rows = self.db.execute('SELECT surface.surface, surface.folded, '
+                               'surface.form_id, lemmas.lemma, ' +
+                               ', '.join('forms.' + cc for cc in COLUMNS) +
+                               ', forms.form FROM surface '
+                               'JOIN forms ON forms.rowid = surface.form_id '
+                               'JOIN lemmas ON lemmas.id = forms.lemma_id '
+                               'ORDER BY lemmas.id, forms.seq')
+        for row in rows:
+            yield row[0], row[1], row[2], analysis_of(row[3:])
+
+    def reopen(self):
+        # A new connection to the same store, for another process
+        return ParadigmStore(self.filename, self.kind, self.surface_forms)
+
+    def close(self):
+        self.db.close()
+
+    def keys(self):
+        return [row[0].encode('utf-8') for row in
+                self.db.execute('SELECT lemma FROM lemmas ORDER BY id')]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __contains__(self, word):
+        return self.lemma_id(word) is not None
+
+    def get(self, word, default=None):
+        try:
+            return self[word]
+        except KeyError:
+            return default
+
+    @profiling.stage('shelf_read')
+    def __getitem__(self, word):
+        profiling.count('shelf_reads')
+        rows = self.db.execute('SELECT lemmas.gender, ' +
+                               ', '.join('forms.' + cc for cc in COLUMNS) +
+                               ', forms.form FROM lemmas '
+                               'LEFT JOIN forms ON forms.lemma_id = lemmas.id '
+                               'WHERE lemmas.lemma = ? ORDER BY forms.seq',
+                               (to_text(word),)).fetchall()
+        if not rows:
+            raise KeyError(word)
+        paradigm = {}
+        if rows[0][0] is not None:
+            paradigm['gender'] = rows[0][0].encode('utf-8')
+        for row in rows:
+            form = row[-1]
+            if form is None:
+                continue
+            if self.kind == 'verb':
+                form = form.encode('utf-8')
+            path = [key.encode('utf-8') for key in row[1:-1]
+                    if key is not None]
+            node = paradigm
+            for key in path[:-1]:
+                if key not in node:
+                    node[key] = {}
+                node = node[key]
+            node[path[-1]] = form
+        return paradigm
+
+    def __setitem__(self, word, paradigm):
+        with self.db:
+            self.write(word, paradigm)
+
+    def __delitem__(self, word):
+        with self.db:
+            if not self.delete(word):
+                raise KeyError(word)
+
+    def update(self, paradigms):
+        # Writes many (word, paradigm) pairs in one transaction
+        with self.db:
+            for word, paradigm in paradigms:
+                self.write(word, paradigm)
+
+    def lemma_id(self, word):
+        row = self.db.execute('SELECT id FROM lemmas WHERE lemma = ?',
+                              (to_text(word),)).fetchone()
+        if row:
+            return row[0]
+        return None
+
+    def delete(self, word):
+        lemma_id = self.lemma_id(word)
+        if lemma_id is None:
+            return False
+        self.db.execute('DELETE FROM surface WHERE form_id IN '
+                        '(SELECT rowid FROM forms WHERE lemma_id = ?)',
+                        (lemma_id,))
+        self.db.execute('DELETE FROM forms WHERE lemma_id = ?', (lemma_id,))
+        self.db.execute('DELETE FROM lemmas WHERE id = ?', (lemma_id,))
+        return True
+
+    @profiling.stage('shelf_write')
+    def write(self, word, paradigm):
+        profiling.count('shelf_writes')
+        self.delete(word)
+        cursor = self.db.execute('INSERT INTO lemmas (lemma, gender) '
+                                 'VALUES (?, ?)',
+                                 (to_text(word),
+                                  to_text(paradigm.get('gender'))))
+        lemma_id = cursor.lastrowid
+        rows = []
+        for path, form in self.flatten(paradigm, []):
+            if self.kind == 'noun':
+                names = NOUN_PATH
+            else:
+                names = VERB_PATHS[len(path)]
+            columns = dict(zip(names, path))
+            rows.append([lemma_id, len(rows)] +
+                        [to_text(columns.get(cc)) for cc in COLUMNS] +
+                        [to_text(form)])
+        self.db.executemany('INSERT INTO forms VALUES (' +
+                            ', '.join('?' * (len(COLUMNS) + 3)) + ')', rows)
+        forms = self.db.execute('SELECT rowid, form FROM forms '
+                                'WHERE lemma_id = ?', (lemma_id,))
+        self.db.executemany('INSERT INTO surface VALUES (?, ?, ?)',
+                            self.surface_rows(forms.fetchall()))
+
+    def flatten(self, node, path):
+        for key, value in node.iteritems():
+            if not path and key == 'gender':
+                continue
+            if isinstance(value, dict):
+                for row in self.flatten(value, path + [key]):
+                    yield row
+            else:
+                yield path + [key], value
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+
+import cProfile
+import functools
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+
+# Functions listed in the report's hottest section
+HOTTEST = 30
+
+ENABLED = False
+STARTED = None
+STAGES = {}
+COUNTERS = {}
+PROFILER = None
+LOCK = threading.Lock()
+LOCAL = threading.local()
+
+
+def enable(cprofile=False):
+    global ENABLED, STARTED, PROFILER
+    ENABLED = True
+    STARTED = time.time()
+    if cprofile:
+        PROFILER = cProfile.Profile()
+        PROFILER.enable()
+
+
+def count(name, amount=1):
+    # Callers on hot paths check ENABLED first to skip the call
+    if not ENABLED:
+        return
+    with LOCK:
+        COUNTERS[name] = COUNTERS.get(name, 0) + amount
+
+
+def stage(name):
+    # Decorates a function whose calls are timed as the named stage. A
+    # stage's self time leaves out the stages it calls, so the self times
+    # add up to the time spent in stages on each thread.
+    def decorate(func):
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            if not ENABLED:
+                return func(*args, **kwargs)
+            stack = getattr(LOCAL, 'stack', None)
+            if stack is None:
+                stack = LOCAL.stack = []
+            stack.append(0.0)
+            start = time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.time() - start
+                inner = stack.pop()
+                if stack:
+                    stack[-1] += elapsed
+                record(name, elapsed, elapsed - inner)
+        return timed
+    return decorate
+
+
+def record(name, elapsed, self_elapsed):
+    with LOCK:
+        if name not in STAGES:
+            STAGES[name] = {'calls': 0, 'seconds': 0.0, 'self_seconds': 0.0}
+        STAGES[name]['calls'] += 1
+        STAGES[name]['seconds'] += elapsed
+        STAGES[name]['self_seconds'] += self_elapsed
+
+
+def take():
+    # Hands back this process's stages and counters and starts them afresh,
+    # so a pool worker can send what it did along with its results
+    with LOCK:
+        taken = {'stages': dict(STAGES), 'counters': dict(COUNTERS)}
+        STAGES.clear()
+        COUNTERS.clear()
+    LOCAL.stack = []
+    return taken
+
+
+def merge(taken):
+    # Adds a worker's take() to this process's stages and counters. Workers
+    # run alongside the parent, so stage times can add up to more than the
+    # wall time.
+    with LOCK:
+        for name, ss in taken['stages'].iteritems():
+            if name not in STAGES:
+                STAGES[name] = {'calls': 0, 'seconds': 0.0,
+                                'self_seconds': 0.0}
+            for key in ('calls', 'seconds', 'self_seconds'):
+                STAGES[name][key] += ss[key]
+        for name, amount in taken['counters'].iteritems():
+            COUNTERS[name] = COUNTERS.get(name, 0) + amount
+
+
+def report(extra=None):
+    wall = time.time() - STARTED
+    staged = sum(ss['self_seconds'] for ss in STAGES.values())
+    result = {'argv': sys.argv, 'wall_seconds': wall,
+              'unstaged_seconds': max(0.0, wall - staged),
+              'stages': STAGES, 'counters': COUNTERS}
+    if extra:
+        result.update(extra)
+    if PROFILER:
+        PROFILER.disable()
+        result['hottest'] = hottest(pstats.Stats(PROFILER))
+    return result
+
+
+def hottest(stats):
+    rows = []
+    for (filename, line, func), row in stats.stats.iteritems():
+        calls, total_calls, self_seconds, seconds = row[:4]
+        rows.append({'function': '%s:%d(%s)' % (filename, line, func),
+                     'calls': total_calls, 'self_seconds': self_seconds,
+                     'seconds': seconds})
+    rows.sort(key=lambda row: row['self_seconds'], reverse=True)
+    return rows[:HOTTEST]
+
+
+def save(filename, extra=None):
+    # Writes the JSON report, and with cProfile on the raw stats alongside
+    # it as filename.prof for pstats or a viewer
+    result = report(extra)
+    if PROFILER:
+        PROFILER.dump_stats(filename + '.prof')
+    tmpname = filename + '.tmp'
+    with open(tmpname, 'w') as ff:
+        json.dump(result, ff, indent=1, sort_keys=True)
+    os.rename(tmpname, filename)
+    print 'Wrote profile to ' + filename
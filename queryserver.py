@@ -0,0 +1,302 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import BaseHTTPServer
+import json
+import time
+import urlparse
+from collections import OrderedDict, deque
+
+import ankigreekutil as anki
+import formindex
+import nouns
+import verbs
+from paradigmstore import ParadigmStore
+
+HOST = '127.0.0.1'
+PORT = 8642
+CACHE_SIZE = 512
+# Latencies kept per endpoint for the percentiles in /metrics
+LATENCY_WINDOW = 1000
+ENDPOINTS = ['paradigm', 'analyze', 'cards', 'metrics']
+KINDS = ['noun', 'verb']
+
+
+def main():
+    args = parse_args()
+    server = QueryServer((args.host, args.port), args.nouns, args.verbs,
+                         args.cache_size, args.verbose)
+    print 'Serving on http://%s:%d/' % (args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser('Query server')
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--nouns', default='nouns.db',
+                        help="noun store, or an index from formindex.py "
+                        "--export if it ends in .idx")
+    parser.add_argument('--verbs', default='verbs.db',
+                        help="verb store or index")
+    parser.add_argument('--cache-size', type=int, default=CACHE_SIZE,
+                        help="decoded paradigms kept in memory")
+    parser.add_argument('--verbose', action='store_true',
+                        help="log every request")
+    return parser.parse_args()
+
+
+def open_shelf(filename, kind):
+    if filename.endswith('.idx'):
+        return formindex.FormIndex(filename)
+    return ParadigmStore(filename, kind, {'noun': nouns.surface_forms,
+                                          'verb': verbs.all_words}[kind])
+
+
+class LRUCache(object):
+    # The maxsize most recently used values, counting hits and misses
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, load):
+        # The cached value of key, or else load(key), which then takes the
+        # place of the least recently used value
+        if key in self.entries:
+            value = self.entries.pop(key)
+            self.entries[key] = value
+            self.hits += 1
+            return value
+        self.misses += 1
+        value = load(key)
+        self.entries[key] = value
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+        return value
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'size': len(self.entries), 'capacity': self.maxsize,
+                'hits': self.hits, 'misses': self.misses,
+                'hit_rate': float(self.hits) / lookups if lookups else None}
+
+
+class CachedShelf(object):
+    # A store or index whose paradigms are read through a cache shared by
+    # both kinds. Paradigms handed out are shared, so must not be changed.
+    # The words are indexed by folded key once, as the shelf stays as it is
+    # while served.
+
+    def __init__(self, shelf, kind, cache):
+        self.shelf = shelf
+        self.kind = kind
+        self.cache = cache
+        self.words = anki.word_index(shelf.keys())
+
+    def load(self, key):
+        return self.shelf[key[1]]
+
+    def __getitem__(self, word):
+        return self.cache.get((self.kind, word), self.load)
+
+    def get(self, word, default=None):
+        try:
+            return self[word]
+        except KeyError:
+            return default
+
+    def __contains__(self, word):
+        return (self.kind, word) in self.cache.entries or word in self.shelf
+
+    def keys(self):
+        return self.shelf.keys()
+
+    def analyze(self, surface):
+        return self.shelf.analyze(surface)
+
+    def close(self):
+        self.shelf.close()
+
+
+class Metrics(object):
+    # Request counts and latencies for each endpoint
+
+    def __init__(self):
+        self.started = time.time()
+        self.endpoints = {}
+
+    def record(self, endpoint, seconds, status):
+        if endpoint not in ENDPOINTS:
+            endpoint = 'other'
+        if endpoint not in self.endpoints:
+            self.endpoints[endpoint] = {
+                'requests': 0, 'errors': 0, 'seconds': 0.0, 'max': 0.0,
+                'recent': deque(maxlen=LATENCY_WINDOW)}
+        stats = self.endpoints[endpoint]
+        stats['requests'] += 1
+        if status >= 400:
+            stats['errors'] += 1
+        stats['seconds'] += seconds
+        stats['max'] = max(stats['max'], seconds)
+        stats['recent'].append(seconds)
+
+    def report(self):
+        endpoints = {}
+        for endpoint, stats in self.endpoints.iteritems():
+            recent = sorted(stats['recent'])
+            endpoints[endpoint] = {
+                'requests': stats['requests'],
+                'errors': stats['errors'],
+                'mean_ms': 1000 * stats['seconds'] / stats['requests'],
+                'p50_ms': 1000 * recent[len(recent) // 2],
+                'p95_ms': 1000 * recent[len(recent) * 95 // 100],
+                'max_ms': 1000 * stats['max']}
+        return {'uptime': time.time() - self.started, 'endpoints': endpoints}
+
+
+class QueryError(Exception):
+
+    def __init__(self, status, message):
+        Exception.__init__(self, message)
+        self.status = status
+
+
+def query_params(query):
+    # The first value of each parameter, kept as utf-8 str like the shelf's
+    # words. Anything that isn't utf-8 is the client's mistake, not ours.
+    params = {}
+    for key, values in urlparse.parse_qs(query).iteritems():
+        try:
+            key.decode('utf-8')
+            values[0].decode('utf-8')
+        except UnicodeDecodeError:
+            raise QueryError(400, 'Parameters must be UTF-8')
+        params[key] = values[0]
+    return params
+
+
+class QueryServer(BaseHTTPServer.HTTPServer):
+    # Answers one request at a time, as sqlite connections stay with the
+    # thread that opened them
+
+    def __init__(self, address, nouns_file, verbs_file,
+                 cache_size=CACHE_SIZE, verbose=False):
+        BaseHTTPServer.HTTPServer.__init__(self, address, QueryHandler)
+        self.verbose = verbose
+        self.cache = LRUCache(cache_size)
+        self.metrics = Metrics()
+        self.shelves = {'noun': CachedShelf(open_shelf(nouns_file, 'noun'),
+                                            'noun', self.cache),
+                        'verb': CachedShelf(open_shelf(verbs_file, 'verb'),
+                                            'verb', self.cache)}
+        # word_defs reads the noun shelf as a global
+        nouns.SHELF = self.shelves['noun']
+
+    def close(self):
+        self.server_close()
+        for shelf in self.shelves.values():
+            shelf.close()
+
+    def answer(self, endpoint, params):
+        if endpoint not in ENDPOINTS:
+            raise QueryError(404, 'No such endpoint: ' + endpoint)
+        return getattr(self, 'answer_' + endpoint)(params)
+
+    def shelf(self, params):
+        kind = params.get('kind', 'noun')
+        if kind not in KINDS:
+            raise QueryError(400, 'Bad kind: ' + kind)
+        return self.shelves[kind]
+
+    def word(self, shelf, params):
+        if 'word' not in params:
+            raise QueryError(400, 'Missing word')
+        word = anki.find_word(params['word'], shelf, shelf.words)
+        if word not in shelf:
+            raise QueryError(404, 'No such word: ' + params['word'])
+        return word
+
+    def answer_paradigm(self, params):
+        shelf = self.shelf(params)
+        word = self.word(shelf, params)
+        return {'word': word, 'paradigm': shelf[word]}
+
+    def answer_analyze(self, params):
+        # Analyses of a form in either kind, or just the one asked for
+        if 'form' not in params:
+            raise QueryError(400, 'Missing form')
+        kinds = [params['kind']] if 'kind' in params else KINDS
+        analyses = []
+        for kind in kinds:
+            for analysis in self.shelf({'kind': kind}).analyze(
+                    params['form']):
+                analysis['kind'] = kind
+                analyses.append(analysis)
+        return {'form': params['form'], 'analyses': analyses}
+
+    def answer_cards(self, params):
+        # A word's card lines as the deck files would have them; verbs take
+        # a comma-separated list of tenses as --tenses does
+        shelf = self.shelf(params)
+        word = self.word(shelf, params)
+        if shelf.kind == 'noun':
+            forward, reverse = nouns.word_defs(word, (word,))
+        else:
+            try:
+                cards = verbs.subset_cards(shelf[word],
+                                           [params.get('tenses')])[0]
+            except Exception as ee:
+                raise QueryError(400, str(ee))
+            card_mm, card_rr = verbs.group_cards(cards)
+            forward = [verbs.deck_line(kk, vv)
+                       for kk, vv in verbs.sorted_fronts(card_mm)]
+            reverse = [verbs.deck_line(kk, vv)
+                       for kk, vv in sorted(card_rr.iteritems())]
+        return {'word': word, 'forward': forward, 'reverse': reverse}
+
+    def answer_metrics(self, params):
+        report = self.metrics.report()
+        report['cache'] = self.cache.stats()
+        return report
+
+
+class QueryHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    # GET /paradigm?kind=noun&word=ὁ λόγος, /analyze?form=λόγου,
+    # /cards?kind=verb&word=λύω&tenses=present and /metrics, answered in
+    # JSON; errors come back as {"error": message}
+
+    def do_GET(self):
+        started = time.time()
+        url = urlparse.urlparse(self.path)
+        endpoint = url.path.strip('/')
+        try:
+            params = query_params(url.query)
+            status, body = 200, self.server.answer(endpoint, params)
+        except QueryError as ee:
+            status, body = ee.status, {'error': str(ee)}
+        except Exception as ee:
+            status, body = 500, {'error': repr(ee)}
+        data = json.dumps(body)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        self.server.metrics.record(endpoint, time.time() - started, status)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, format,
+                                                              *args)
+
+
+if __name__ == '__main__':
+    main()
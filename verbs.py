@@ -2,14 +2,19 @@
 # -*- coding: utf-8 -*-
 
 import argparse
-import re
-import shelve
+import itertools
+from array import array
 
 import ankigreekutil as anki
+import paradigmdata
+import profiling
+from paradigmstore import ParadigmStore
 
 
 WIKTIONARY = 'http://en.wiktionary.org/wiki/'
 WORDS = ['λύω']
+# Words handed to each process-pool worker at a time
+CARD_CHUNK = 16
 REPRESENTATIONS = {'imperfect': '(παρατατικός)<br>----    |',
                    'present': '(ἐνεστὼς χρόνος)<br>--|--',
                    'future': '(μέλλων)<br>|    -<br>|    -----',
@@ -45,6 +50,17 @@ PERSON = ['1st', '2nd', '3rd', '2nd dual', '3rd dual', '1st plural',
 GENDER = ['m', 'f', 'n']
 CASE = ['Nominative', 'Vocative', 'Genitive', 'Dative', 'Accusative']
 NUMBER = ['Singular', 'Dual', 'Plural']
+# The participle cases set_verb_form is given for each number; the others
+# are the same forms
+PARTICIPLE_CASES = {'Singular': ['Nominative', 'Genitive', 'Dative',
+                                 'Accusative', 'Vocative'],
+                    'Dual': ['Nominative', 'Genitive'],
+                    'Plural': ['Nominative', 'Genitive', 'Dative',
+                               'Accusative']}
+PARTICIPLE_ALIASES = {('Dual', 'Accusative'): 'Nominative',
+                      ('Dual', 'Vocative'): 'Nominative',
+                      ('Dual', 'Dative'): 'Genitive',
+                      ('Plural', 'Vocative'): 'Nominative'}
 VERBFILE = 'verbs'
 REVERSEFILE = 'reverse_verbs'
 
@@ -64,11 +80,7 @@ def set_verb_form(verb, voice, mood, tense, forms):
         return
 
     if mood == 'participle':
-        part_cases = {'Singular': ['Nominative', 'Genitive', 'Dative',
-                                   'Accusative', 'Vocative'],
-                      'Dual':     ['Nominative', 'Genitive'],
-                      'Plural':   ['Nominative', 'Genitive', 'Dative',
-                                   'Accusative']}
+        part_cases = PARTICIPLE_CASES
 
         for number in NUMBER:
             verb[voice][mood][tense][number] = {}
@@ -96,6 +108,36 @@ def set_verb_form(verb, voice, mood, tense, forms):
         verb[voice][mood][tense][PERSON[ii]] = forms[ii]
 
 
+@profiling.stage('prepare')
+def install_conjugated(filename):
+    # Conjugates every verb in a principal parts file into the shelf,
+    # writing only the paradigms that changed, and adds them to WORDS.
+    # With --anki the curated paradigms are installed afterwards and win.
+    import conjugation
+    for word, parts in conjugation.read_principal_parts(filename):
+        paradigm = conjugate(parts)
+        if SHELF.get(word) != paradigm:
+            SHELF[word] = paradigm
+            profiling.count('conjugated_installed')
+        if word not in WORDS:
+            WORDS.append(word)
+
+
+def conjugate(parts):
+    # A paradigm from a verb's principal parts, made by the conjugation
+    # engine instead of typed in as prepare_shelf's are
+    import conjugation
+    verb = {}
+    blocks = conjugation.conjugate(parts)
+    for vv in VOICE:
+        for tt in TENSE:
+            for mm in MOOD:
+                if (vv, mm, tt) in blocks:
+                    set_verb_form(verb, vv, mm, tt, blocks[vv, mm, tt])
+    return verb
+
+
+@profiling.stage('prepare')
 def prepare_shelf():
     luo = {}
 
@@ -176,9 +218,9 @@ def prepare_shelf():
                    'λύ̄σαιεν / λύ̄σειαν'])
 
     set_verb_form(luo, 'active', 'optative', '1st perfect',
-                  ['λελυκὼς εἴην / λελύκοιμι / λελύκοίην',
-                   'λελυκὼς εἴης / λελύκοις / λελύκοίης',
-                   'λελυκὼς εἴη / λελύκοι / λελύκοίη',
+                  ['λελυκὼς εἴην / λελύκοιμι / λελυκοίην',
+                   'λελυκὼς εἴης / λελύκοις / λελυκοίης',
+                   'λελυκὼς εἴη / λελύκοι / λελυκοίη',
                    'λελυκότε εἴητον / λελυκότε εἶτον / λελύκοιτον',
                    'λελυκότε εἰήτην / λελυκότε εἴτην / λελυκοίτην',
                    'λελυκότες εἴημεν / λελυκότες εἶμεν / λελύκοιμεν',
@@ -209,7 +251,7 @@ def prepare_shelf():
                    ['λύ̄σαντες', 'λύ̄σᾱσαι', 'λύ̄σαντα'],
                    ['λῡσάντων', 'λῡσᾱσῶν', 'λῡσάντων'],
                    ['λύ̄σᾱσι(ν)', 'λῡσά̄σαις', 'λύ̄σᾱσι(ν)'],
-                   ['λύ̄σαντας', 'λῡσά̄σας', 'λύ̄σαντα']])
+                   ['λύ̄σαντας', 'λῡσά̄σᾱς', 'λύ̄σαντα']])
 
     set_verb_form(luo, 'active', 'participle', '1st perfect',
                   [['λελυκώς', 'λελυκυῖα', 'λελυκός'],
@@ -441,9 +483,39 @@ def parse_args():
     parser.add_argument('--get')
     parser.add_argument('--show')
     parser.add_argument('--anki', action='store_true')
+    parser.add_argument('--conjugate', metavar='FILE',
+                        help="make the paradigms of the verbs in FILE from "
+                        "their principal parts; with --anki they get cards "
+                        "too")
     parser.add_argument('--showtenses', action='store_true')
-    parser.add_argument('--tenses',
-                        help="comma-separated list of tenses to study")
+    parser.add_argument('--parse', metavar='FORM',
+                        help="show every analysis of an inflected form")
+    parser.add_argument('--index', metavar='FILE',
+                        help="answer --show and --parse from an index "
+                        "written by formindex.py --export")
+    parser.add_argument('--reindex', action='store_true',
+                        help="rebuild the inflected form index")
+    parser.add_argument('--tenses', action='append',
+                        help="comma-separated list of tenses to study; "
+                        "repeat for a pair of card files per list")
+    parser.add_argument('--deck-spec', metavar='FILE',
+                        help="file with a --tenses list on each line")
+    parser.add_argument('--jobs', type=int, default=1,
+                        help="processes making cards for --anki")
+    parser.add_argument('--stream', action='store_true',
+                        help="group cards on disk to keep memory flat")
+    parser.add_argument('--apkg', action='store_true',
+                        help="also write each deck as an Anki package")
+    parser.add_argument('--diff-against', metavar='PREVIOUS',
+                        help="with --anki, also write the cards added, "
+                        "changed and removed since the card files in the "
+                        "PREVIOUS directory, as verbs.added.txt and so on")
+    parser.add_argument('--profile', metavar='FILE',
+                        help="write the time spent in each stage and other "
+                        "counts to FILE as JSON")
+    parser.add_argument('--cprofile', action='store_true',
+                        help="with --profile, also list the hottest "
+                        "functions and save cProfile stats to FILE.prof")
     return parser.parse_args()
 
 
@@ -475,22 +547,161 @@ def make_participle_answer(voice, mood, tense, number, case, gender):
     return article + u'<br>' + unicode(answer, 'utf-8')
 
 
+def answer_table():
+    # Every label make_cards can give, keyed by the path to the form in a
+    # paradigm: (voice, mood, tense), then the person or, for participles,
+    # the number, case and gender
+    table = {}
+    for vv in VOICE:
+        for mm in MOOD:
+            for tt in TENSE:
+                if mm == 'participle':
+                    for nn in NUMBER:
+                        for cc in CASE:
+                            for gg in GENDER:
+                                answer = make_participle_answer(vv, mm, tt,
+                                                                nn, cc, gg)
+                                table[vv, mm, tt, nn, cc, gg] = \
+                                    intern(answer.encode('utf-8'))
+                elif mm == 'infinitive':
+                    table[vv, mm, tt] = intern(make_answer(vv, mm, tt))
+                else:
+                    for pp in PERSON:
+                        table[vv, mm, tt, pp] = \
+                            intern(make_answer(vv, mm, tt, pp))
+    return table
+
+
+# Built by load_card_tables when the first cards are made, since --show and
+# --get never need them
+ANSWERS = None
+
+
+def participle_cells():
+    # Where each number, case and gender of a participle is kept in a
+    # VerbParadigm block: its own cell, or the cell of the case it shares
+    rows = [(nn, cc) for nn in NUMBER for cc in PARTICIPLE_CASES[nn]]
+    cells = {}
+    for nn in NUMBER:
+        for cc in CASE:
+            row = rows.index((nn, PARTICIPLE_ALIASES.get((nn, cc), cc)))
+            for jj, gg in enumerate(GENDER):
+                cells[nn, cc, gg] = row * len(GENDER) + jj
+    return cells
+
+
+PARTICIPLE_CELLS = participle_cells()
+BLOCKS = [(vv, mm, tt) for vv in VOICE for mm in MOOD for tt in TENSE]
+BLOCK_IDS = dict((block, ii) for ii, block in enumerate(BLOCKS))
+
+
+def block_cards():
+    # For each block, the cell and answer of every card it can give, in the
+    # order make_cards gives them
+    cards = []
+    for vv, mm, tt in BLOCKS:
+        if mm == 'participle':
+            cards.append([(PARTICIPLE_CELLS[nn, cc, gg],
+                           ANSWERS[vv, mm, tt, nn, cc, gg])
+                          for nn in NUMBER for cc in CASE for gg in GENDER])
+        elif mm == 'infinitive':
+            cards.append([(0, ANSWERS[vv, mm, tt])])
+        else:
+            cards.append([(ii, ANSWERS[vv, mm, tt, pp])
+                          for ii, pp in enumerate(PERSON)])
+    return cards
+
+
+BLOCK_CARDS = None
+
+
+def load_card_tables():
+    global ANSWERS, BLOCK_CARDS
+    if BLOCK_CARDS is None:
+        ANSWERS = answer_table()
+        BLOCK_CARDS = block_cards()
+
+
+class VerbParadigm(object):
+    # A verb's forms in one flat tuple instead of nested dicts. Each voice,
+    # mood and tense the verb has is a block of the tuple: a form for each
+    # person, one infinitive, or the participle cells, where cases that
+    # share their forms are kept once (see PARTICIPLE_ALIASES).
+    # offsets holds where each of BLOCKS starts, or -1. moods keeps the
+    # moods in MOOD order, which make_cards follows, so the cards do not
+    # depend on the order of a dict.
+    __slots__ = ('moods', 'offsets', 'forms')
+
+    def __init__(self, verb):
+        # Verify
+        for vv in verb.keys():
+            if vv not in VOICE:
+                raise Exception('bad voice: ' + vv)
+            for mm in verb[vv].keys():
+                if mm not in MOOD:
+                    raise Exception('bad mood: ' + mm)
+                for tt in verb[vv][mm]:
+                    if tt not in TENSE:
+                        raise Exception('bad tense: ' + tt)
+
+        moods = []
+        offsets = array('h', [-1]) * len(BLOCKS)
+        forms = []
+        for vv in VOICE:
+            # Deponents have no active
+            for mm in MOOD:
+                if mm not in verb.get(vv, {}):
+                    continue
+                moods.append((vv, mm))
+                for tt, value in verb[vv][mm].iteritems():
+                    if not value:
+                        continue
+                    offsets[BLOCK_IDS[vv, mm, tt]] = len(forms)
+                    forms.extend(block_forms(mm, value))
+        self.moods = tuple(moods)
+        self.offsets = offsets
+        self.forms = tuple(forms)
+
+
+def block_forms(mm, value):
+    if mm == 'infinitive':
+        return [value]
+    if mm != 'participle':
+        return [value[pp] for pp in PERSON]
+    forms = []
+    for nn in NUMBER:
+        for cc in PARTICIPLE_CASES[nn]:
+            for gg in GENDER:
+                forms.append(value[nn][cc][gg])
+    for (nn, cc), alias in PARTICIPLE_ALIASES.iteritems():
+        for gg in GENDER:
+            if value[nn][cc][gg] != value[nn][alias][gg]:
+                raise Exception('Participle ' + nn + ' ' + cc +
+                                ' differs from ' + alias)
+    return forms
+
+
 def all_words(word):
     output = []
     words = word.split(' / ')
     for word in words:
-        if re.match(r'^.*\(ν\)$', word):
+        if word.endswith('(ν)'):
             output.append(word[0:-4])
             output.append(word[0:-4] + 'ν')
             continue
         if word:
             output.append(word)
+    if profiling.ENABLED:
+        profiling.count('all_words_forms', len(output))
     return output
 
 
 def make_cards(word, tenses):
-    cards = []
+    for card in subset_cards(word, [tenses])[0]:
+        yield card
+
 
+def tense_list(tenses):
     if tenses:
         mytenses = tenses.split(',')
     else:
@@ -498,106 +709,298 @@ def make_cards(word, tenses):
     for tense in mytenses:
         if tense not in TENSE:
             raise Exception('Bad tense: ' + tense)
+    return mytenses
+
+
+@profiling.stage('cards')
+def subset_cards(word, subsets):
+    # The cards for each subset of tenses, in the order make_cards would
+    # give them for that subset alone. Each tense's cards are made once and
+    # shared by every subset that includes it. word is a VerbParadigm or
+    # the nested dicts that the shelf holds.
+    subsets = [tense_list(tenses) for tenses in subsets]
+    load_card_tables()
+    if not isinstance(word, VerbParadigm):
+        word = VerbParadigm(word)
+
+    wanted = set(tt for mytenses in subsets for tt in mytenses)
+    output = [[] for mytenses in subsets]
+    for vv, mm in word.moods:
+        blocks = {}
+        for tt in wanted:
+            blocks[tt] = tense_cards(word, vv, mm, tt)
+        for cards, mytenses in zip(output, subsets):
+            for tt in mytenses:
+                cards.extend(blocks[tt])
+    return output
 
-    # Verify
-    for vv in word.keys():
-        if vv not in VOICE:
-            raise Exception('bad voice: ' + vv)
-        for mm in word[vv].keys():
-            if mm not in MOOD:
-                raise Exception('bad mood: ' + mm)
-            for tt in word[vv][mm]:
-                if tt not in TENSE:
-                    raise Exception('bad tense: ' + tt)
 
-    for vv in VOICE:
-        for mm in word[vv].keys():
-            if mm == 'participle':
-                for tt in mytenses:
-                    if not word[vv][mm].get(tt):
-                        continue
-                    for nn in NUMBER:
-                        for cc in CASE:
-                            for gg in GENDER:
-                                words = all_words(word[vv][mm][tt][nn][cc][gg])
-                                for form in words:
-                                    if form:
-                                        answer = make_participle_answer(vv,
-                                                                        mm,
-                                                                        tt,
-                                                                        nn,
-                                                                        cc,
-                                                                        gg)
-                                        cards.append([form,
-                                                      answer.encode('utf-8')])
-                continue
-            if mm == 'infinitive':
-                for tt in mytenses:
-                    if word[vv][mm].get(tt):
-                        for form in all_words(word[vv][mm][tt]):
-                            form = word[vv][mm][tt]
-                            cards.append([form, make_answer(vv, mm, tt)])
-                continue
-            # for normal moods
-            for tt in mytenses:
-                if not word[vv][mm].get(tt):
-                    continue
-                for pp in PERSON:
-                    for form in all_words(word[vv][mm][tt][pp]):
-                        cards.append([form, make_answer(vv, mm, tt, pp)])
+def tense_cards(paradigm, vv, mm, tt):
+    cards = []
+    block = BLOCK_IDS[vv, mm, tt]
+    offset = paradigm.offsets[block]
+    if offset < 0:
+        return cards
+    forms = paradigm.forms
+    if mm == 'infinitive':
+        form = forms[offset]
+        answer = BLOCK_CARDS[block][0][1]
+        for word in all_words(form):
+            cards.append([form, answer])
+        return cards
+    for cell, answer in BLOCK_CARDS[block]:
+        for word in all_words(forms[offset + cell]):
+            cards.append([word, answer])
     return cards
 
 
-def output_cards(tenses=None):
-    cards = []
-    for word in WORDS:
-        cards.extend(make_cards(SHELF[word], tenses))
-    card_mm = {}
-    card_rr = {}
-    for card in cards:
-        if not card_mm.get(card[0]):
-            card_mm[card[0]] = []
-        if not card_rr.get(card[1]):
-            card_rr[card[1]] = []
-        unique = True
-        for cc in card_mm[card[0]]:
-            if card[1] == cc:
-                unique = False
-        if unique:
-            card_mm[card[0]].append(card[1])
-        unique = True
-        for cc in card_rr[card[1]]:
-            if card[0] == cc:
-                unique = False
-        if unique:
-            card_rr[card[1]].append(card[0])
+def open_worker_shelf():
+    # Forked workers share the parent's SHELF; a store gets its own
+    # connection, as sqlite connections must not cross a fork
+    global SHELF
+    if isinstance(SHELF, ParadigmStore):
+        SHELF = SHELF.reopen()
+    # Drop the stages and counts forked from the parent, which has them
+    if profiling.ENABLED:
+        profiling.take()
+
+
+def subset_cards_task(task):
+    # With --profile a worker's stages and counts go back with each word's
+    # cards, for word_cards to merge
+    word, subsets = task
+    result = subset_cards(SHELF[word], subsets)
+    if profiling.ENABLED:
+        return result, profiling.take()
+    return result, None
+
+
+def word_cards(subsets, jobs=1):
+    # Yields the cards of each word in WORDS order, for each subset of
+    # tenses. Workers read each paradigm themselves, so it is built exactly
+    # as it would be here, and imap hands back each word's cards in the
+    # order the words were given.
+    if jobs <= 1 or len(WORDS) < 2:
+        for word in WORDS:
+            yield subset_cards(SHELF[word], subsets)
+        return
+    # Imported here, like apkg and formindex, to keep them off the startup
+    # path of runs that don't use them
+    import multiprocessing
+    pool = multiprocessing.Pool(min(jobs, len(WORDS)), open_worker_shelf)
+    try:
+        for result, taken in pool.imap(subset_cards_task,
+                                       [(word, subsets) for word in WORDS],
+                                       CARD_CHUNK):
+            if taken:
+                profiling.merge(taken)
+            yield result
+    finally:
+        pool.close()
+        pool.join()
+
+
+def all_cards(subsets, jobs=1):
+    output = [[] for tenses in subsets]
+    for result in word_cards(subsets, jobs):
+        for cards, cards_of_word in zip(output, result):
+            cards.extend(cards_of_word)
+    return output
+
+
+def read_deck_spec(filename):
+    # One comma-separated list of tenses per line, as for --tenses
+    subsets = []
+    with open(filename) as ff:
+        for line in ff:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                subsets.append(line)
+    return subsets
+
+
+@profiling.stage('build')
+def output_cards(tenses=None, jobs=1, stream=False, package=False):
+    # tenses is a comma-separated list of tenses to study, or a list of
+    # them to write a pair of card files for each
+    if isinstance(tenses, list):
+        subsets = tenses
+    else:
+        subsets = [tenses]
+    if stream:
+        stream_cards(subsets, jobs, package)
+        return
+    for tenses, cards in zip(subsets, all_cards(subsets, jobs)):
+        write_cards(tenses, cards, package)
+
+
+def card_files(tenses):
     verbfile = VERBFILE + '.txt'
     reversefile = REVERSEFILE + '.txt'
     if tenses:
         verbfile = VERBFILE + '.' + tenses + '.txt'
         reversefile = REVERSEFILE + '.' + tenses + '.txt'
-    with open(verbfile, 'w') as ff:
-        for kk, vv in card_mm.iteritems():
-            ff.write(kk + '; ' + '<br><br>'.join(vv) + "\n")
-    with open(reversefile, 'w') as ff:
-        for kk, vv in card_rr.iteritems():
-            ff.write(kk + '; ' + '<br><br>'.join(vv) + "\n")
+    return verbfile, reversefile
+
+
+def write_cards(tenses, cards, package=False):
+    # Lines are sorted by their front, as stream_cards writes them
+    card_mm, card_rr = group_cards(cards)
+    verbfile, reversefile = card_files(tenses)
+    write_deck(verbfile, sorted_fronts(card_mm), package)
+    write_deck(reversefile, sorted(card_rr.iteritems()), package)
+
+
+def sorted_fronts(card_mm):
+    # Forward lines in the order of their forms' NFC keys
+    return sorted(card_mm.iteritems(), key=lambda item: anki.nfc_key(item[0]))
+
+
+def stream_cards(subsets, jobs=1, package=False):
+    # Like write_cards for every subset, but holding no more than a few
+    # runs of cards at a time: the lines come out sorted by their front
+    groupers = [(CardGrouper('cards_deduped'), CardGrouper())
+                for tenses in subsets]
+    for result in word_cards(subsets, jobs):
+        for (forward, reverse), cards in zip(groupers, result):
+            for form, answer in cards:
+                key = anki.nfc_key(form)
+                forward.add(key, answer, (form, answer))
+                reverse.add(answer, key, (answer, form))
+    # A reverse line holds a form of every word, so lines go straight to
+    # the file rather than being buffered in their thousands
+    for tenses, pair in zip(subsets, groupers):
+        for filename, grouper in zip(card_files(tenses), pair):
+            write_deck(filename, grouper.groups(), package, 1)
+
+
+@profiling.stage('deck')
+def write_deck(filename, groups, package=False,
+               flush_size=anki.DECK_FLUSH_SIZE):
+    # Writes a card file, and with package an Anki package of it too
+    writers = [anki.DeckWriter(filename, flush_size)]
+    if package:
+        import apkg
+        writers.append(apkg.ApkgWriter(*apkg.package_for(filename),
+                                       css=apkg.MONOSPACE_CSS))
+    try:
+        for kk, vv in groups:
+            line = deck_line(kk, vv)
+            for writer in writers:
+                writer.write(line)
+    except:
+        for writer in writers:
+            writer.abort()
+        raise
+    for writer in writers:
+        writer.close()
+
+
+def deck_line(front, backs):
+    return front + '; ' + '<br><br>'.join(backs)
+
+
+class CardGrouper(object):
+    # Groups (key, value) pairs as group_cards does, through sorted runs on
+    # disk. groups() yields each key in sorted order with its values in the
+    # order they were added, less repeats, which are counted as counter.
+    # A pair can be shown as another (key, value), such as a form whose
+    # NFC key it is: each group takes the key its first pair is shown with.
+
+    def __init__(self, counter=None, run_size=anki.SORT_RUN_SIZE):
+        self.counter = counter
+        self.run_size = run_size
+        self.pairs = anki.SortedRuns(run_size)
+        self.count = 0
+
+    def add(self, key, value, shown=None):
+        self.pairs.add((key, value, self.count, shown or (key, value)))
+        self.count += 1
+
+    def groups(self):
+        # Sorted by value, repeats of a pair sit together and the first
+        # keeps its position; sorting again by position restores the order
+        firsts = anki.SortedRuns(self.run_size)
+        last = None
+        repeats = 0
+        for key, value, position, shown in self.pairs.merged():
+            if (key, value) != last:
+                firsts.add((key, position, shown))
+                last = (key, value)
+            else:
+                repeats += 1
+        if self.counter:
+            profiling.count(self.counter, repeats)
+        for key, records in itertools.groupby(firsts.merged(),
+                                              lambda record: record[0]):
+            shown = [record[2] for record in records]
+            yield shown[0][0], [pair[1] for pair in shown]
+
+
+@profiling.stage('group')
+def group_cards(cards):
+    # Map each form to its answers and each answer to its forms, in the
+    # order they first appear, dropping repeated (form, answer) pairs.
+    # Forms are compared by their NFC keys, read straight from the cache,
+    # and each is written as it first came for its key.
+    by_key = {}
+    card_rr = {}
+    shown = {}
+    seen = set()
+    keys = anki.NFC_KEYS[str]
+    for card in cards:
+        key, answer = keys.get(card[0]) or anki.nfc_key(card[0]), card[1]
+        if key not in by_key:
+            by_key[key] = []
+            shown[key] = card[0]
+        if answer not in card_rr:
+            card_rr[answer] = []
+        if (key, answer) not in seen:
+            seen.add((key, answer))
+            by_key[key].append(answer)
+            card_rr[answer].append(card[0])
+    profiling.count('cards_deduped', len(cards) - len(seen))
+    card_mm = dict((shown[key], answers) for key, answers in
+                   by_key.iteritems())
+    return card_mm, card_rr
 
 
 def main():
     args = parse_args()
+    if args.profile:
+        profiling.enable(args.cprofile)
     if args.showtenses:
         print TENSE
     if args.get:
-        prepare_shelf()
+        paradigmdata.install('verb', SHELF)
+    if args.conjugate:
+        install_conjugated(args.conjugate)
+    lookup = SHELF
+    if args.index:
+        import formindex
+        lookup = formindex.FormIndex(args.index)
     if args.show:
-        anki.show_forms(args.show, SHELF)
+        anki.show_forms(args.show, lookup)
+    if args.reindex:
+        SHELF.reindex()
+    if args.parse:
+        anki.show_analyses(args.parse, lookup)
     if args.anki:
-        output_cards(args.tenses)
+        paradigmdata.install('verb', SHELF)
+        subsets = args.tenses or []
+        if args.deck_spec:
+            subsets.extend(read_deck_spec(args.deck_spec))
+        output_cards(subsets or None, args.jobs, args.stream, args.apkg)
+        if args.diff_against:
+            for tenses in subsets or [None]:
+                for filename in card_files(tenses):
+                    anki.write_deck_diff(filename, args.diff_against)
+    if args.profile:
+        profiling.save(args.profile)
 
 
 if __name__ == '__main__':
     global SHELF
-    SHELF = shelve.open('verbs.shelf')
+    SHELF = ParadigmStore('verbs.db', 'verb', all_words)
     main()
     SHELF.close()
@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import bz2
+import os
+import re
+from xml.etree import cElementTree as ElementTree
+
+import ankigreekutil as anki
+import declension
+import profiling
+
+LANGUAGE = 'Ancient Greek'
+# Pages between checkpoints; each batch of paradigms is written in one
+# transaction just before its checkpoint is saved
+CHECKPOINT_PAGES = 10000
+# Bytes read at a time; compressed text can decompress to a hundred times
+# that, and each chunk is held whole until its pages have been read
+READ_SIZE = 1 << 14
+PAGE_START = '<page>'
+PAGE_END = '</page>'
+LANGUAGE_RE = re.compile(r'^==\s*([^=]+?)\s*==\s*$', re.MULTILINE)
+NOUN_RE = re.compile(r'\{\{grc-noun\|([^{}]*)\}\}')
+VERB_RE = re.compile(r'\{\{grc-verb\b')
+LINK_RE = re.compile(r'\[\[(?:[^|\]]*\|)?([^\]]*)\]\]')
+# Gender codes of the grc-noun template, as declension.decline takes them
+GENDERS = {'m': 'm', 'f': 'f', 'n': 'n', 'mf': 'm/f', 'm/f': 'm/f',
+           'm,f': 'm/f', 'c': 'm/f'}
+ARTICLES = {'m': u'ὁ', 'f': u'ἡ', 'n': u'τὸ', 'm/f': u'ὁ/ἡ'}
+DECLENSIONS = {'first': 1, 'second': 2, 'third': 3,
+               '1': 1, '2': 2, '3': 3}
+
+
+def checkpoint_file(dump):
+    return os.path.basename(dump) + '.checkpoint'
+
+
+def open_dump(dump, offset=0):
+    if dump.endswith('.bz2'):
+        return Bz2Reader(dump, offset)
+    return XmlReader(dump, offset)
+
+
+class XmlReader(object):
+    # Reads a plain XML dump in chunks from offset on. Each chunk comes as
+    # (offset, skip, data), the text at data[ii] being found again by
+    # reading from offset and dropping skip + ii bytes.
+
+    def __init__(self, filename, offset=0):
+        self.ff = open(filename, 'rb')
+        self.ff.seek(offset)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def chunks(self):
+        while True:
+            offset = self.ff.tell()
+            data = self.ff.read(READ_SIZE)
+            if not data:
+                return
+            yield offset, 0, data
+
+    def place(self, offset, skip):
+        # The same place as an offset into the file
+        return offset + skip, 0
+
+    def close(self):
+        self.ff.close()
+
+
+class Bz2Reader(XmlReader):
+    # Reads a bz2 file through every stream in it, as the multistream dumps
+    # hold thousands of them and bz2.BZ2File stops after the first. The
+    # offset of a chunk is where its stream starts in the file, and skip
+    # how much that stream had decompressed to before it, so a place in a
+    # multistream dump is reached again by decompressing one stream.
+
+    def __init__(self, filename, offset=0):
+        XmlReader.__init__(self, filename, offset)
+        self.decompressor = bz2.BZ2Decompressor()
+        self.stream = offset
+        self.done = 0
+
+    def chunks(self):
+        while True:
+            offset = self.ff.tell()
+            chunk = self.ff.read(READ_SIZE)
+            if not chunk:
+                return
+            for piece in self.decompress(chunk, offset):
+                yield piece
+
+    def decompress(self, chunk, offset):
+        # The pieces chunk, read at offset, decompresses to, one for each
+        # stream it holds a part of
+        try:
+            data = self.decompressor.decompress(chunk)
+        except EOFError:
+            # The last stream ended exactly at the end of a chunk
+            self.new_stream(offset)
+            data = self.decompressor.decompress(chunk)
+        pieces = []
+        if data:
+            pieces.append((self.stream, self.done, data))
+            self.done += len(data)
+        rest = self.decompressor.unused_data
+        if rest:
+            start = offset + len(chunk) - len(rest)
+            self.new_stream(start)
+            pieces += self.decompress(rest, start)
+        return pieces
+
+    def new_stream(self, offset):
+        self.decompressor = bz2.BZ2Decompressor()
+        self.stream = offset
+        self.done = 0
+
+    def place(self, offset, skip):
+        return offset, skip
+
+
+def read_pages(dump, offset=0, skip=0):
+    # Yields the title and wikitext of every main namespace page from a
+    # place in the dump on, with the place just after the page as (offset,
+    # skip) for open_dump and a later read_pages. Pages are cut out of the
+    # text at their tags, which the wikitext in them has escaped, and
+    # parsed one at a time, so memory stays flat however large the dump.
+    with open_dump(dump, offset) as reader:
+        text = ''
+        for at, done, data in reader.chunks():
+            if at == offset and done < skip:
+                # Text before the place read_pages was asked to start at
+                data = data[skip - done:]
+                done = skip
+            # Where data starts in text, which holds the rest of the last
+            # chunk's text after its last whole page
+            start = len(text)
+            text += data
+            pos = 0
+            end = text.find(PAGE_END, max(0, start - len(PAGE_END)))
+            while end >= 0:
+                end += len(PAGE_END)
+                page = ElementTree.fromstring(
+                    text[text.index(PAGE_START, pos):end])
+                pos = end
+                if page.findtext('ns') in (None, '0'):
+                    yield (page.findtext('title'),
+                           page.findtext('revision/text') or u'',
+                           reader.place(at, done + end - start))
+                end = text.find(PAGE_END, pos)
+            text = text[pos:]
+
+
+def language_section(text, language=LANGUAGE):
+    # The wikitext under the ==language== heading, up to the next language
+    headings = list(LANGUAGE_RE.finditer(text))
+    for ii, heading in enumerate(headings):
+        if heading.group(1) == language:
+            end = (headings[ii + 1].start() if ii + 1 < len(headings)
+                   else len(text))
+            return text[heading.end():end]
+    return None
+
+
+def noun_entries(title, section):
+    # (word, nominative, genitive, gender, declension) for every grc-noun
+    # headword in the section, declension being None where the template
+    # does not give one
+    for match in NOUN_RE.finditer(section):
+        params = [LINK_RE.sub(r'\1', param).strip()
+                  for param in match.group(1).split('|')]
+        params = [param for param in params if '=' not in param]
+        if len(params) < 3 or params[2] not in GENDERS:
+            continue
+        nominative = params[0] or title
+        genitive = params[1].split('/')[0].split(',')[0].strip()
+        gender = GENDERS[params[2]]
+        decl = DECLENSIONS.get(params[3]) if len(params) > 3 else None
+        word = (ARTICLES[gender] + u' ' + title).encode('utf-8')
+        yield word, nominative, genitive, gender, decl
+
+
+def paradigms(title, text):
+    # The paradigms an Ancient Greek page gives, by word. Verb headwords
+    # only give the lemma, not the principal parts conjugation.py needs,
+    # so they are counted and left for the --conjugate file.
+    section = language_section(text)
+    if section is None:
+        return
+    if profiling.ENABLED:
+        profiling.count('dump_verbs_skipped', len(VERB_RE.findall(section)))
+    for word, nominative, genitive, gender, decl in noun_entries(title,
+                                                                 section):
+        try:
+            yield word, declension.decline(
+                nominative, genitive, gender,
+                decl or declension.declension_of(word, nominative, genitive))
+        except Exception:
+            profiling.count('dump_nouns_failed')
+
+
+@profiling.stage('ingest')
+def ingest(dump, shelf, checkpoint_pages=CHECKPOINT_PAGES):
+    # Declines every Ancient Greek noun in a Wiktionary dump into the shelf,
+    # leaving alone the words it already has. Progress is saved every
+    # checkpoint_pages pages with the place after the last page read, and
+    # a run over the same dump starts reading from there; the checkpoint
+    # goes once the dump is done.
+    checkpoint = anki.load_json(checkpoint_file(dump)) or {}
+    size = os.path.getsize(dump)
+    if (checkpoint.get('dump') != os.path.abspath(dump) or
+            checkpoint.get('size') != size or 'offset' not in checkpoint):
+        checkpoint = {'dump': os.path.abspath(dump), 'size': size,
+                      'pages': 0, 'offset': 0, 'skip': 0, 'installed': 0}
+    elif checkpoint['pages']:
+        print 'Resuming %s after %d pages' % (dump, checkpoint['pages'])
+    pages = checkpoint['pages']
+    place = checkpoint['offset'], checkpoint['skip']
+    batch = {}
+    for title, text, place in read_pages(dump, *place):
+        pages += 1
+        if u'{{grc-' in text:
+            for word, paradigm in paradigms(title, text):
+                if word not in batch and word not in shelf:
+                    batch[word] = paradigm
+        if pages % checkpoint_pages == 0:
+            save_checkpoint(dump, checkpoint, shelf, batch, pages, place)
+            batch = {}
+            print '%d pages, %d nouns' % (pages, checkpoint['installed'])
+    profiling.count('dump_pages', pages - checkpoint['pages'])
+    save_checkpoint(dump, checkpoint, shelf, batch, pages, place)
+    os.remove(checkpoint_file(dump))
+    print 'Read %d pages of %s, %d nouns added' % (pages, dump,
+                                                   checkpoint['installed'])
+
+
+def save_checkpoint(dump, checkpoint, shelf, batch, pages, place):
+    shelf.update(batch.iteritems())
+    profiling.count('dump_nouns_installed', len(batch))
+    checkpoint['pages'] = pages
+    checkpoint['offset'], checkpoint['skip'] = place
+    checkpoint['installed'] += len(batch)
+    anki.save_json(checkpoint_file(dump), checkpoint)